@@ -1,32 +1,87 @@
-from sys import path
-import pandas as pd
+import os
+import json
+import tempfile
 import dash
+import flask
 from dash import dcc
 from dash import html
-import plotly.express as px
 import numpy as np
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
 import dash_table
+import store
+import schema
+import precompute
+import snapshot
+import filters
+import players
+import franchise
+import figures
+import payloads
+import cache
+import search
+import warmup
 
-#load csv files in dictionaries for player and merged team data
-def load_df_dict(type, table_ids):
-    df_dict = {}
-    for table_id in table_ids:
-        if type in ['player']:
-            path = r'data/players/{}.csv'.format(table_id)
-        if type in ['merged']:
-            path =  r'data/teams/merged_{}.csv'.format(table_id)
-        df_dict[table_id] = pd.read_csv(path)
-        for col in df_dict[table_id].columns:
-            df_dict[table_id][col] = pd.to_numeric(df_dict[table_id][col], errors = 'ignore')
-    return df_dict
+#number of tables per dictionary kept in memory, least recently used tables are evicted
+max_resident_tables = int(os.environ.get('NFL_PYPLOT_MAX_TABLES', 4))
 
-player_table_ids = ['passing',  'rushing', 'receiving', 'scrimmage', 'defense', 'returns', 'scoring']
-player_df_dict = load_df_dict('player', player_table_ids)
+#'pandas' filters the in-memory frames, 'sqlite' queries the indexed database built by scrape/build_database.py
+query_backend = os.environ.get('NFL_PYPLOT_QUERY_BACKEND', 'pandas')
 
-merged_table_ids = ['team_stats', 'passing', 'rushing', 'returns', 'team_scoring', 'team_conversions', 'drives']
-merged_df_dict = load_df_dict('merged', merged_table_ids)
+#seconds between checks of data/ for a new scrape or columnar build, 0 turns hot reload off
+reload_interval = int(os.environ.get('NFL_PYPLOT_RELOAD_INTERVAL', 30))
+
+#scatters of more points than this are drawn with webgl and without a label on each point
+webgl_points = int(os.environ.get('NFL_PYPLOT_WEBGL_POINTS', figures.webgl_points))
+
+#most points a webgl scatter is thinned to, keeping the extremes and searched names, 0 draws every point
+point_budget = int(os.environ.get('NFL_PYPLOT_POINT_BUDGET', 0))
+
+#bins along each axis of the density view
+density_bins = int(os.environ.get('NFL_PYPLOT_DENSITY_BINS', figures.density_bins))
+
+#print the size of every callback response, sizes are counted on /stats either way
+log_payloads = os.environ.get('NFL_PYPLOT_LOG_PAYLOADS', '1') not in ['0']
+
+#megabytes of figures kept for repeated views, 0 turns the figure cache off
+figure_cache_mb = float(os.environ.get('NFL_PYPLOT_FIGURE_CACHE_MB', 64))
+
+#directory of the figure and dropdown results every worker on the host shares, and the megabytes
+#it may hold, 0 turns the shared cache off
+shared_cache_dir = os.environ.get('NFL_PYPLOT_SHARED_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'nfl-pyplot-cache'))
+shared_cache_mb = float(os.environ.get('NFL_PYPLOT_SHARED_CACHE_MB', 256))
+
+#gunicorn workers warm the caches with the inputs in warmup.json and the most requested recorded
+#inputs before taking requests, see gunicorn.conf.py. 0 turns the warm-up off. the inputs are
+#recorded in the shared cache's directory, which only this user can write to
+warmup_enabled = os.environ.get('NFL_PYPLOT_WARMUP', '1') not in ['0']
+warmup_recorded = int(os.environ.get('NFL_PYPLOT_WARMUP_RECORDED', 20))
+traffic_file = os.environ.get('NFL_PYPLOT_TRAFFIC_FILE', os.path.join(shared_cache_dir, 'traffic.json'))
+
+#player and merged team data in dictionaries that load a category on first access, from the typed
+#columnar copies when present, with the precomputed option lists, team lists and league baselines.
+#callbacks read all of it from snapshots.current(), which is swapped whole when the data changes
+player_table_ids = store.player_table_ids
+merged_table_ids = store.merged_table_ids
+snapshots = snapshot.SnapshotManager(max_resident = max_resident_tables, interval = reload_interval, backend = query_backend)
+if not snapshots.current().artifacts.from_bundle:
+    print('No current artifact bundle in {}, computing artifacts live'.format(precompute.bundle_path))
+
+#figures and search options of views already drawn, in this worker and in files shared with the
+#other workers. keys hold the data version and the shared files are salted with the settings that
+#change what the callbacks return and the version of the code
+shared_cache = None
+if shared_cache_mb:
+    try:
+        shared_cache = cache.SharedCache(
+            shared_cache_dir,
+            max_bytes = int(shared_cache_mb * 2 ** 20),
+            salt = json.dumps([query_backend, webgl_points, point_budget, density_bins, precompute.incomplete_seasons, cache.code_version()])
+        )
+    except PermissionError as e:
+        print('Not sharing cached results between workers: {}'.format(e))
+traffic_log = warmup.TrafficLog(traffic_file)
+figure_cache = cache.FigureCache(lambda: snapshots.current().version, max_bytes = int(figure_cache_mb * 2 ** 20), shared = shared_cache, recorder = traffic_log)
 
 #set dict for color schemes
 colors = {
@@ -34,22 +89,12 @@ colors = {
     'text': '#111111'
 }
 
-#create blank figure as figure placeholder
-fig = px.scatter()
-compare_fig = px.scatter()
+#layout every figure is built on, transparent backgrounds and the text color
+figure_template = figures.layout_template(colors['text'])
 
-fig.update_layout(
-    plot_bgcolor = 'rgba(0, 0, 0, 0)',
-    paper_bgcolor = 'rgba(0, 0, 0, 0)',
-    font_color=colors['text'],
-    )
-compare_fig.update_layout(
-    width = 500,
-    height = 500,
-    plot_bgcolor = 'rgba(0, 0, 0, 0)',
-    paper_bgcolor = 'rgba(0, 0, 0, 0)',
-    font_color=colors['text'],
-)
+#create blank figure as figure placeholder
+fig = figures.blank(figure_template)
+compare_fig = figures.blank(figures.layout_template(colors['text'], width = 500, height = 500))
 
 #Create dash application
 app = dash.Dash(__name__, title = 'NFL-PYPLOT', external_stylesheets = [dbc.themes.JOURNAL], suppress_callback_exceptions = True)
@@ -208,6 +253,23 @@ sidebar_individual = [
                                 ),
                 ], vertical = 'False'),
 
+                html.P(
+                    '''View''',
+                    style = {'marginBottom' : '0',
+                            'marginTop' : '10px'
+                            }
+                ),
+                dcc.RadioItems(id = 'view-mode',
+                            options = [
+                                {'label' : 'Points', 'value' : 'points'},
+                                {'label' : 'Density', 'value' : 'density'}
+                            ],
+                            value = 'points',
+                            labelStyle = {'display' : 'inline-block',
+                                        'marginRight' : '10px'
+                            },
+                            style = {'font-size': '12px'}
+                ),
                 html.P('''
                 '''
                 ),
@@ -230,72 +292,36 @@ sidebar_team_compare = [
     html.P("Choose Team Comparison Settings", className="lead"),
     html.Br(),
 
-    html.P('Select Team One: ',
+    html.P('Select Seasons: ',
         style = {
                 'marginBottom' : '2px'
         }
     ),
-    html.Div([
-        dbc.Nav([
-            dcc.Dropdown(id = 'team-compare-year-1',
-                        options = [
-                            {'label' : str(year), 'value': year} for year in np.arange(2006,2022,1)
-                        ],
-                        style = {'width' : "50%", 
-                                'height' : "20px",
-                                'font-size': '12px',
-                                'marginRight' : '0px'
-                        },
-                        placeholder = 'Year'
-            ),
-            dcc.Dropdown(id = 'team-compare-team-1',
-                        options = [
-                            {'label': 'No Year Selected', 'value' : None}
-                        ],
-                        style = {'width' : "50%", 
-                                'height' : "20px",
-                                'font-size': '12px',
-                                'marginBottom' : '30px',
-                                'marginLeft' : '0px'
-                        },
-                        placeholder = 'Team'
-            )
-            ],
-            vertical = False)
-        ]),
-    html.P('Select Team Two: ',
+    dcc.Dropdown(id = 'team-compare-years',
+                options = [
+                    {'label' : str(year), 'value': year} for year in np.arange(2006,2022,1)
+                ],
+                multi = True,
+                style = {'width' : "100%", 
+                        'font-size': '12px',
+                        'marginBottom' : '10px'
+                },
+                placeholder = 'Years'
+    ),
+    html.P('Select Teams: ',
         style = {
                 'marginBottom' : '2px'
         }
     ),
-    html.Div([
-        dbc.Nav([
-            dcc.Dropdown(id = 'team-compare-year-2',
-                        options = [
-                            {'label' : str(year), 'value': year} for year in np.arange(2006,2022,1)
-                        ],
-                        style = {'width' : "50%", 
-                                'height' : "20px",
-                                'font-size': '12px',
-                                'marginRight' : '0px'
-                        },
-                        placeholder = 'Year'
-            ),
-            dcc.Dropdown(id = 'team-compare-team-2',
-                        options = [
-                            {'label': 'No Year Selected', 'value' : None}
-                        ],
-                        style = {'width' : "50%", 
-                                'height' : "20px",
-                                'font-size': '12px',
-                                'marginBottom' : '30px',
-                                'marginLeft' : '0px'
-                        },
-                        placeholder = 'Team'
-            )
-            ],
-            vertical = False)
-    ]),
+    dcc.Dropdown(id = 'team-compare-teams',
+                options = [],
+                multi = True,
+                style = {'width' : "100%", 
+                        'font-size': '12px',
+                        'marginBottom' : '30px'
+                },
+                placeholder = 'Team and Year'
+    ),
     html.Br(),
     html.P('Plots Axes:',
         style = {
@@ -313,9 +339,7 @@ sidebar_team_compare = [
         dbc.Nav([
             dcc.Dropdown(
                 id = 'compare-pass-x',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['passing'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'passing'),
                 placeholder = 'X-Axis Data',
                 value = 'Y/A',
                 style = {'width' : "50%", 
@@ -326,9 +350,7 @@ sidebar_team_compare = [
             ),
             dcc.Dropdown(
                 id = 'compare-pass-y',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['passing'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'passing'),
                 placeholder = 'Y-Axis Data',
                 value = 'opp_Y/A',
                 style = {'width' : "50%", 
@@ -350,9 +372,7 @@ sidebar_team_compare = [
         dbc.Nav([
             dcc.Dropdown(
                 id = 'compare-rush-x',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['rushing'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'rushing'),
                 placeholder = 'X-Axis Data',
                 value = 'Y/A',
                 style = {'width' : "50%", 
@@ -363,9 +383,7 @@ sidebar_team_compare = [
             ),
             dcc.Dropdown(
                 id = 'compare-rush-y',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['rushing'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'rushing'),
                 placeholder = 'Y-Axis Data',
                 value = 'opp_Y/A',
                 style = {'width' : "50%", 
@@ -387,9 +405,7 @@ sidebar_team_compare = [
         dbc.Nav([
             dcc.Dropdown(
                 id = 'compare-drive-x',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['drives'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'drives'),
                 placeholder = 'X-Axis Data',
                 value = 'Yds',
                 style = {'width' : "50%", 
@@ -400,9 +416,7 @@ sidebar_team_compare = [
             ),
             dcc.Dropdown(
                 id = 'compare-drive-y',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['drives'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'drives'),
                 placeholder = 'Y-Axis Data',
                 value = 'opp_Yds',
                 style = {'width' : "50%", 
@@ -424,9 +438,7 @@ sidebar_team_compare = [
         dbc.Nav([
             dcc.Dropdown(
                 id = 'compare-overall-x',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['team_stats'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'team_stats'),
                 placeholder = 'X-Axis Data',
                 value = 'Y/P',
                 style = {'width' : "50%", 
@@ -437,9 +449,7 @@ sidebar_team_compare = [
             ),
             dcc.Dropdown(
                 id = 'compare-overall-y',
-                options=[
-                        {'label' : col, 'value': col} for col in merged_df_dict['team_stats'].columns[1:] if col not in ['Tm','Rk']
-                ],
+                options=snapshots.current().artifacts.options('merged', 'team_stats'),
                 placeholder = 'Y-Axis Data',
                 value = 'opp_Y/P',
                 style = {'width' : "50%", 
@@ -680,23 +690,32 @@ def update_category_dropdown(pathname):
             ]
     return options
 
-#populate search dropdowns
+#what is typed is matched case-insensitively on its words, so only they are part of the key
+def normalize_search_inputs(category, years, pathname, search_value, selected):
+    years = None if years is None else sorted(set(int(year) for year in years if year is not None))
+    pathname = '/player-statistics' if pathname in ['/'] else pathname
+    return [category, years, pathname, ' '.join(search.tokens(search_value or '')), selected]
+
+#populate search dropdowns with the top matches for what has been typed, keeping the names already selected
 @app.callback(
     Output(component_id = 'search-dropdown', component_property = 'options'),
     Input(component_id = 'category_dropdown', component_property = 'value'),
     Input(component_id = 'year', component_property = 'value'),
-    Input(component_id= 'url', component_property= 'pathname')
+    Input(component_id= 'url', component_property= 'pathname'),
+    Input(component_id = 'search-dropdown', component_property = 'search_value'),
+    State(component_id = 'search-dropdown', component_property = 'value')
 )
-def pop_search_dropdown(category, years, pathname):
+@figure_cache.cached(normalize_search_inputs)
+def pop_search_dropdown(category, years, pathname, search_value, selected):
+    snap = snapshots.current()
+    selected = [name for name in selected or [] if name not in [None]]
     if pathname in ['/', '/player-statistics']:
-        df = player_df_dict[category]
-        dff = df[df['Year'].isin(years)]
-        player_options = [{'label': name, 'value' : name} for name in dff['Player'].unique()]
+        names = snap.search.search('player', category, 'Player', search_value or '', years)
+        player_options = [{'label': name, 'value' : name} for name in selected + [name for name in names if name not in selected]]
         return player_options
     elif pathname in ['/team-statistics']:
-        df = merged_df_dict[category]
-        dff = df[df['Year'].isin(years)]
-        team_options = [{'label': team, 'value' : team} for team in dff['Tm'].unique()]
+        names = snap.search.search('merged', category, 'Tm', search_value or '', years)
+        team_options = [{'label': team, 'value' : team} for team in selected + [name for name in names if name not in selected]]
         return team_options
 
 #create callback for x-axis data using columns of selected category
@@ -706,12 +725,11 @@ def pop_search_dropdown(category, years, pathname):
     Input(component_id= 'url', component_property= 'pathname')
 )
 def columns_for_df(selected_category, pathname):
+    snap = snapshots.current()
     if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[1:] if col not in ['Tm','Rk']]
+        return snap.artifacts.options('merged', selected_category)
     else:
-        df = player_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[3:] if col not in ['Pos','G','GS']]
+        return snap.artifacts.joined_options(selected_category)
 
 @app.callback(
     Output(component_id = 'x-axis-range', component_property = 'min'),
@@ -726,23 +744,21 @@ def columns_for_df(selected_category, pathname):
     Input(component_id = 'x-axis-range', component_property = 'value'),
 )
 def update_range_slider(selected_category, years, x_axis_col, pathname, values):
-    if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
-    else: 
-        df = player_df_dict[selected_category]
-    df = df[df['Year'].isin(years)][x_axis_col]
-    if df.min() != 0:
-        step = abs((float(df.max()) / float(df.min())) / 100)
+    snap = snapshots.current()
+    type = 'merged' if pathname == '/team-statistics' else 'player'
+    col_min, col_max = snap.column_range(type, selected_category, x_axis_col, years)
+    if col_min != 0:
+        step = abs((float(col_max) / float(col_min)) / 100)
     else: 
-        step = abs(float(df.max())/ 100)
-    #value = [float(df.min()), float(df.max())]
+        step = abs(float(col_max)/ 100)
+    #value = [float(col_min), float(col_max)]
     marks = {
-        int(df.min()): '{}'.format(df.min()),
-        int(df.max()): '{}'.format(df.max()),
+        int(col_min): '{}'.format(col_min),
+        int(col_max): '{}'.format(col_max),
         int(values[0]) : '{}'.format(int(values[0])),
         int(values[1]) : '{}'.format(int(values[1])),   
     }
-    return df.min(), df.max(), step, marks#, value
+    return schema.display_value(col_min), schema.display_value(col_max), step, marks#, value
 @app.callback(
     Output(component_id = 'x-axis-range', component_property = 'value'),
     Input(component_id = 'category_dropdown', component_property = 'value'),
@@ -751,12 +767,10 @@ def update_range_slider(selected_category, years, x_axis_col, pathname, values):
     Input(component_id= 'url', component_property= 'pathname')
 )
 def x_range_min_max(selected_category, years, x_axis_col, pathname):
-    if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
-    else: 
-        df = player_df_dict[selected_category]
-    df = df[df['Year'].isin(years)][x_axis_col]
-    value = [float(df.min()), float(df.max())]
+    snap = snapshots.current()
+    type = 'merged' if pathname == '/team-statistics' else 'player'
+    col_min, col_max = snap.column_range(type, selected_category, x_axis_col, years)
+    value = [schema.display_value(col_min), schema.display_value(col_max)]
     return value
 
 #create callback for y-axis data using columns of selected category
@@ -766,12 +780,11 @@ def x_range_min_max(selected_category, years, x_axis_col, pathname):
     Input(component_id= 'url', component_property= 'pathname')
 )
 def columns_for_df(selected_category, pathname):
+    snap = snapshots.current()
     if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[1:] if col not in ['Tm','Rk']]
+        return snap.artifacts.options('merged', selected_category)
     else:
-        df = player_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[3:] if col not in ['Pos','G','GS']]
+        return snap.artifacts.joined_options(selected_category)
 @app.callback(
     Output(component_id = 'y-axis-range', component_property = 'min'),
     Output(component_id = 'y-axis-range', component_property = 'max'),
@@ -785,23 +798,21 @@ def columns_for_df(selected_category, pathname):
     Input(component_id = 'y-axis-range', component_property = 'value')
 )
 def update_range_slider(selected_category, years, y_axis_col, pathname, values):
-    if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
+    snap = snapshots.current()
+    type = 'merged' if pathname == '/team-statistics' else 'player'
+    col_min, col_max = snap.column_range(type, selected_category, y_axis_col, years)
+    if col_min != 0:
+        step = abs((float(col_max) / float(col_min)) / 100)
     else: 
-        df = player_df_dict[selected_category]
-    df = df[df['Year'].isin(years)][y_axis_col]
-    if df.min() != 0:
-        step = abs((float(df.max()) / float(df.min())) / 100)
-    else: 
-        step = abs(float(df.max())/ 100)
-    #value = [float(df.min()), float(df.max())]
+        step = abs(float(col_max)/ 100)
+    #value = [float(col_min), float(col_max)]
     marks = {
-        int(df.min()): '{}'.format(df.min()),
-        int(df.max()): '{}'.format(df.max()),
+        int(col_min): '{}'.format(col_min),
+        int(col_max): '{}'.format(col_max),
         int(values[0]) : '{}'.format(int(values[0])),
         int(values[1]) : '{}'.format(int(values[1])),   
     }
-    return df.min(), df.max(), step, marks#, value
+    return schema.display_value(col_min), schema.display_value(col_max), step, marks#, value
 @app.callback(
     Output(component_id = 'y-axis-range', component_property = 'value'),
     Input(component_id = 'category_dropdown', component_property = 'value'),
@@ -810,12 +821,10 @@ def update_range_slider(selected_category, years, y_axis_col, pathname, values):
     Input(component_id= 'url', component_property= 'pathname')
 )
 def x_range_min_max(selected_category, years, y_axis_col, pathname):
-    if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
-    else:
-        df = player_df_dict[selected_category]
-    df = df[df['Year'].isin(years)][y_axis_col]
-    value = [float(df.min()), float(df.max())]
+    snap = snapshots.current()
+    type = 'merged' if pathname == '/team-statistics' else 'player'
+    col_min, col_max = snap.column_range(type, selected_category, y_axis_col, years)
+    value = [schema.display_value(col_min), schema.display_value(col_max)]
     return value
 
 #create callback for color using columns of selected category
@@ -825,12 +834,11 @@ def x_range_min_max(selected_category, years, y_axis_col, pathname):
     Input(component_id= 'url', component_property= 'pathname')
 )
 def columns_for_df(selected_category, pathname):
+    snap = snapshots.current()
     if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[1:] if col not in ['Tm','Rk']]
+        return snap.artifacts.options('merged', selected_category)
     else:
-        df = player_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[3:] if col not in ['Pos','G','GS']]
+        return snap.artifacts.joined_options(selected_category)
 
 #create callback for size using columns of selected category
 @app.callback(
@@ -839,12 +847,11 @@ def columns_for_df(selected_category, pathname):
     Input(component_id= 'url', component_property= 'pathname')
 )
 def columns_for_df(selected_category, pathname):
+    snap = snapshots.current()
     if pathname == '/team-statistics':
-        df = merged_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[1:] if col not in ['Tm','Rk']]
+        return snap.artifacts.options('merged', selected_category)
     else:
-        df = player_df_dict[selected_category]
-        return [{'label' : col, 'value': col} for col in df.columns[3:] if col not in ['Pos','G','GS']]
+        return snap.artifacts.joined_options(selected_category)
 
 #plot scatter figure based on inputted variables
 """
@@ -857,6 +864,18 @@ Output(component_id = 'color', component_property = 'value'),
 Output(component_id = 'size', component_property = 'value'),
 Output(component_id= 'search-dropdown', component_property='value'),
 """
+#the same view however it was asked for: years sorted, slider bounds rounded, searched names
+#stripped and sorted and the index page as the player page
+def normalize_graph_inputs(selected_category, years, x_axis, x_axis_values, y_axis, y_axis_values, color, size, n_clicks, pathname, search, view_mode = 'points'):
+    years = sorted(set(int(year) for year in years or [] if year is not None))
+    x_axis_values = [float(schema.display_value(value)) for value in x_axis_values] if x_axis_values else x_axis_values
+    y_axis_values = [float(schema.display_value(value)) for value in y_axis_values] if y_axis_values else y_axis_values
+    search = sorted(set(name.rstrip(' ') for name in search if name is not None)) if search not in [None] else None
+    pathname = '/player-statistics' if pathname in ['/'] else pathname
+    #any click of the clear button draws the blank figure
+    n_clicks = None if n_clicks in [None] else 1
+    return [selected_category, years, x_axis, x_axis_values, y_axis, y_axis_values, color, size, n_clicks, pathname, search, view_mode]
+
 @app.callback(
     Output(component_id = 'graph_1', component_property = 'figure'),
     Input(component_id = 'category_dropdown', component_property = 'value'),
@@ -869,95 +888,80 @@ Output(component_id= 'search-dropdown', component_property='value'),
     Input(component_id = 'size', component_property = 'value'),
     Input(component_id = 'clear-button' , component_property = 'n_clicks'),
     Input(component_id= 'url', component_property= 'pathname'),
-    Input(component_id= 'search-dropdown', component_property='value')
+    Input(component_id= 'search-dropdown', component_property='value'),
+    Input(component_id = 'view-mode', component_property = 'value')
 )
-def update_graph(selected_category, years, x_axis, x_axis_values, y_axis, y_axis_values, color, size, n_clicks, pathname, search):
+@figure_cache.cached(normalize_graph_inputs)
+def update_graph(selected_category, years, x_axis, x_axis_values, y_axis, y_axis_values, color, size, n_clicks, pathname, search, view_mode = 'points'):
+    snap = snapshots.current()
     print(n_clicks)
-    fig_blank = px.scatter()
-    fig_blank.update_layout(
-        plot_bgcolor = 'rgba(0, 0, 0, 0)',
-        paper_bgcolor = 'rgba(0, 0, 0, 0)',
-        font_color=colors['text'],
-    )
+    fig_blank = figures.blank(figure_template)
     if n_clicks not in [None]:
         #return fig_blank, None, None, [None], None, None, None, None, [None] 
         return fig_blank
     if pathname in ['/', '/player-statistics', '/team-statistics']:
         if pathname in ['/team-statistics']:
-            df = merged_df_dict[selected_category]
+            type = 'merged'
             player_team = 'Team'
             hover_name = 'Tm'
             hover_data = ['Year']
-            df['split'] = df['Tm'].str.split().str[-1]
         elif pathname in ['/', '/player-statistics']:
-            df = player_df_dict[selected_category]
+            type = 'player'
             player_team = 'Player'
             hover_name = 'Player'
             hover_data = ['Tm', 'Year', 'Pos']
-            df['split'] = df['Player'].str.split().str[-1]
 
-        df = df[df['Year'].isin(years)]
-        df = df[df[x_axis] >= x_axis_values[0]]
-        df = df[df[x_axis] <= x_axis_values[1]]
-        df = df[df[y_axis] >= y_axis_values[0]]
-        df = df[df[y_axis] <= y_axis_values[1]]
+        #columns from other player categories are joined onto the selected rows and filtered after
+        ranges = [(x_axis, *x_axis_values), (y_axis, *y_axis_values)]
+        joined_ranges = [r for r in ranges if players.split_column(r[0])[0] is not None]
+        df = snap.query.select(type, selected_category, years, [r for r in ranges if r not in joined_ranges])
+        df = filters.filter_ranges(snap.players.attach(df, [x_axis, y_axis, color, size]), joined_ranges)
+        names = [name.rstrip(' ') for name in search] if search not in [None] else []
     
-        if color not in [None] and size in [None] and df[color].min() > 0:
+        if color not in [None] and size in [None] and figures.is_continuous(df[color]) and df[color].min() > 0:
             size = color
-        
-        fig = px.scatter(
-            df,
-            x = x_axis, y = y_axis, 
-            hover_name = hover_name, hover_data = hover_data,
-            title = 'NFL {} {} Stats: {} against {}<br>Year(s):{}'.format(player_team, selected_category.title(), x_axis.title(), y_axis.title(), years),
-            color = color, size = size,
-            text = 'split',
-            color_continuous_scale=px.colors.sequential.Blackbody_r[0:2].append(px.colors.sequential.Blackbody_r[3])
-        )
 
-        fig.update_layout(
-            plot_bgcolor = 'rgba(0, 0, 0, 0)',
-            paper_bgcolor = 'rgba(0, 0, 0, 0)',
-            font_color=colors['text']
-        )
+        title = 'NFL {} {} Stats: {} against {}<br>Year(s):{}'.format(player_team, selected_category.title(), x_axis.title(), y_axis.title(), years)
+        if view_mode in ['density'] and figures.is_continuous(df[x_axis]) and figures.is_continuous(df[y_axis]):
+            #a grid of row counts with the extreme rows drawn over it, for views too dense to read as points
+            fig = figures.density(
+                df,
+                x_axis, y_axis, figure_template,
+                title = title + '<br>Density of {:,} rows'.format(len(df)),
+                overlay = schema.display_frame(df.take(figures.thin_positions(df, 0, [x_axis, y_axis]))),
+                hover_name = hover_name, hover_data = hover_data,
+                bins = density_bins
+            )
+        else:
+            points = df
+            #large views are drawn with webgl and no point labels, thinned to the point budget when one is set
+            webgl = len(df) > webgl_points
+            if webgl:
+                if point_budget and len(df) > point_budget:
+                    points = df.take(figures.thin_positions(df, point_budget, [x_axis, y_axis, color, size], filters.name_positions(df[hover_name], names)))
+                title += '<br>WebGL, {:,} of {:,} points, labels hidden'.format(len(points), len(df))
+
+            fig = figures.scatter(
+                schema.display_frame(points),
+                x_axis, y_axis, figure_template,
+                title = title,
+                hover_name = hover_name, hover_data = hover_data,
+                color = color, size = size,
+                text = None if webgl else schema.label_column,
+                webgl = webgl
+            )
         if search not in [None]:
-            try: 
-                for name in search:
-                    fig.add_annotation(
-                        x=df.set_index(hover_name).loc[name.rstrip(' ')][x_axis], 
-                        y=df.set_index(hover_name).loc[name.rstrip(' ')][y_axis],
-                        text="{}".format(name),
-                        font = {'color' : px.colors.sequential.Blackbody_r[3],
-                                'size' : 14},
-                        showarrow = True,
-                        arrowsize = 5,
-                        arrowcolor = px.colors.sequential.Blackbody_r[3],
-                    )
-            except Exception:
-                pass
+            #every row of the searched names, e.g. each season or team of a player, in one overlay trace.
+            #a searched team is highlighted under every name its franchise played as in the view
+            if type in ['merged']:
+                franchise_ids = [franchise.franchise_ids[name] for name in names if name in franchise.franchise_ids]
+                highlighted = schema.display_frame(filters.filter_ranges(snap.query.franchise_history(selected_category, franchise_ids, years), ranges))
+            else:
+                highlighted = schema.display_frame(df.iloc[filters.name_positions(df[hover_name], names)])
+            figures.add_trace(fig, figures.highlight_trace(highlighted, x_axis, y_axis, hover_name))
         if n_clicks == None:
-            if pathname in ['/team-statistics']:
-                fig.add_hline(
-                    y = df[y_axis].mean(),
-                    line_width=1, line_dash="dash"
-                )   
-                fig.add_vline(
-                    x = df[x_axis].mean(),
-                    line_width=1, line_dash="dash"
-                )
-                #return fig, None, selected_category, years, x_axis, y_axis, color, size, search
-                return fig
-            elif pathname in ['/player-statistics', '/']:
-                fig.add_hline(
-                    y = df[y_axis].mean(),
-                    line_width=1, line_dash="dash"
-                )
-                fig.add_vline(
-                    x = df[x_axis].mean(),
-                    line_width=1, line_dash="dash"
-                )
-                #return fig, None, selected_category, years, x_axis, y_axis, color, size, search
-            return fig
+            #return fig, None, selected_category, years, x_axis, y_axis, color, size, search
+            return figures.add_mean_lines(fig, df[x_axis].mean(), df[y_axis].mean())
 
 @app.callback(
     Output(component_id = 'clear-button' , component_property = 'n_clicks'),
@@ -975,19 +979,44 @@ def clear_button(n_clicks):
     if n_clicks not in [None]:
         return None, None, [None], None, None, None, None, [None]#, fig_blank
 
-#create option list for given year in team comparison
+#team comparison dropdown values are 'Tm|Year', so any number of seasons of any teams can be picked
+def compare_value(team_name, year):
+    return '{}|{}'.format(team_name, year)
+
+def compare_key(value):
+    team_name, year = value.rsplit('|', 1)
+    return team_name, int(year)
+
+#create option list of every team in the chosen years for team comparison, keeping the teams already chosen
 @app.callback(
-    Output(component_id = 'team-compare-team-1', component_property = 'options'),
-    Output(component_id = 'team-compare-team-2', component_property = 'options'),
-    Input(component_id = 'team-compare-year-1', component_property = 'value'),
-    Input(component_id = 'team-compare-year-2', component_property = 'value')
+    Output(component_id = 'team-compare-teams', component_property = 'options'),
+    Input(component_id = 'team-compare-years', component_property = 'value'),
+    State(component_id = 'team-compare-teams', component_property = 'value')
 )
-def get_team_list(year_1, year_2):
-    df_1 = merged_df_dict['team_stats'][merged_df_dict['team_stats']['Year'] == year_1]
-    team_dict_1 = [{'label' : team_name,'value' : team_name} for team_name in df_1['Tm'].unique()]
-    df_2 = merged_df_dict['team_stats'][merged_df_dict['team_stats']['Year'] == year_2]
-    team_dict_2 = [{'label' : team_name,'value' : team_name} for team_name in df_2['Tm'].unique()]
-    return team_dict_1, team_dict_2
+def get_team_list(years, selected):
+    snap = snapshots.current()
+    values = list(selected or [])
+    for year in sorted(years or []):
+        values += [compare_value(team_name, year) for team_name in snap.artifacts.teams(year)]
+    return [{'label' : '{} {}'.format(*compare_key(value)), 'value' : value} for value in dict.fromkeys(values)]
+
+#one of the team comparison scatters, against the league's mean and range of its columns
+def compare_figure(snap, df, table_id, x, y, title):
+    fig = figures.scatter(
+        schema.display_frame(df),
+        x, y, figure_template,
+        title = title,
+        hover_name = 'Tm', hover_data = ['Year'],
+        color = x, size = y,
+        text = 'Tm'
+    )
+    figures.add_mean_lines(fig, snap.artifacts.league_mean(table_id, x), snap.artifacts.league_mean(table_id, y))
+    return figures.set_ranges(fig, snap.artifacts.league_range(table_id, x), snap.artifacts.league_range(table_id, y))
+
+#the clear button's click count doesn't change the figures
+def normalize_compare_inputs(teams, pass_x, pass_y, rush_x, rush_y, drive_x, drive_y, ov_x, ov_y, n_clicks, datatable_category):
+    return [list(teams or []), pass_x, pass_y, rush_x, rush_y, drive_x, drive_y, ov_x, ov_y, None, datatable_category]
+
 #update graphs and data table for given teams
 @app.callback(
     Output(component_id = 'compare-graph-1', component_property = 'figure'),
@@ -996,10 +1025,7 @@ def get_team_list(year_1, year_2):
     Output(component_id = 'compare-graph-4', component_property = 'figure'),
     Output(component_id = 'compare-table', component_property = 'columns'),
     Output(component_id = 'compare-table', component_property = 'data'),
-    Input(component_id = 'team-compare-year-1', component_property = 'value'),
-    Input(component_id = 'team-compare-year-2', component_property = 'value'),
-    Input(component_id = 'team-compare-team-1', component_property = 'value'),
-    Input(component_id = 'team-compare-team-2', component_property = 'value'),
+    Input(component_id = 'team-compare-teams', component_property = 'value'),
     Input(component_id = 'compare-pass-x', component_property = 'value'),
     Input(component_id = 'compare-pass-y', component_property = 'value'),
     Input(component_id = 'compare-rush-x', component_property = 'value'),
@@ -1011,137 +1037,19 @@ def get_team_list(year_1, year_2):
     Input(component_id = 'compare-clear-button', component_property = 'n_clicks'),
     Input(component_id = 'table_compare_dropdown', component_property = 'value')
 )
-def update_compare_figures(year_1, year_2, team_1_name, team_2_name, pass_x, pass_y, rush_x, rush_y, drive_x, drive_y, ov_x, ov_y, n_clicks, datatable_category):
-    #plot 1 - Passing
-    df = merged_df_dict['passing'].set_index(['Tm','Year'])
-    pass_df = df.loc[[(team_1_name, year_1), (team_2_name, year_2)]].reset_index()
-    pass_fig = px.scatter(
-        pass_df,
-        x = pass_x,
-        y = pass_y,
-        hover_name = 'Tm',
-        hover_data = ['Year'],
-        title = 'Passing',
-        color = pass_x,
-        size = pass_y,
-        text = 'Tm',
-        color_continuous_scale=px.colors.sequential.Blackbody_r[0:2].append(px.colors.sequential.Blackbody_r[3])
-    )
-    pass_fig.update_layout(
-        plot_bgcolor = 'rgba(0, 0, 0, 0)',
-        paper_bgcolor = 'rgba(0, 0, 0, 0)',
-        font_color=colors['text']
-    )
-    pass_fig.add_hline(
-        y = merged_df_dict['passing'][pass_y][merged_df_dict['passing']['Year'] != 2021].mean(),
-        line_width=1, line_dash="dash",
-    )
-    pass_fig.add_vline(
-        x = merged_df_dict['passing'][pass_x][merged_df_dict['passing']['Year'] != 2021].mean(),
-        line_width=1, line_dash="dash",
-    )
-    dff = merged_df_dict['passing'][merged_df_dict['passing']['Year'] != 2021]
-    pass_fig.update_xaxes(range=[dff[pass_x].min(), dff[pass_x].max()])
-    pass_fig.update_yaxes(range=[dff[pass_y].min(), dff[pass_y].max()])
-
-    #plot 2 - Rushing
-    df = merged_df_dict['rushing'].set_index(['Tm','Year'])
-    rush_df = df.loc[[(team_1_name, year_1), (team_2_name, year_2)]].reset_index()
-    rush_fig = px.scatter(
-        rush_df,
-        x = rush_x,
-        y = rush_y,
-        hover_name = 'Tm',
-        hover_data = ['Year'],
-        title = 'Rushing',
-        color = rush_x,
-        size = rush_y,
-        text = 'Tm',
-        color_continuous_scale=px.colors.sequential.Blackbody_r[0:2].append(px.colors.sequential.Blackbody_r[3])
-    )
-    rush_fig.update_layout(
-        plot_bgcolor = 'rgba(0, 0, 0, 0)',
-        paper_bgcolor = 'rgba(0, 0, 0, 0)',
-        font_color=colors['text']
-    )
-    rush_fig.add_hline(
-        y = merged_df_dict['rushing'][rush_y][merged_df_dict['rushing']['Year'] != 2021].mean(),
-        line_width=1, line_dash="dash",
-    )
-    rush_fig.add_vline(
-        x = merged_df_dict['rushing'][rush_x][merged_df_dict['rushing']['Year'] != 2021].mean(),
-        line_width=1, line_dash="dash",
-    )
-    dff = merged_df_dict['rushing'][merged_df_dict['rushing']['Year'] != 2021]
-    rush_fig.update_xaxes(range=[dff[rush_x].min(), dff[rush_x].max()])
-    rush_fig.update_yaxes(range=[dff[rush_y].min(), dff[rush_y].max()])
-    #plot 3 - Per Drive
-    df = merged_df_dict['drives'].set_index(['Tm','Year'])
-    drives_df = df.loc[[(team_1_name, year_1), (team_2_name, year_2)]].reset_index()
-    drives_fig = px.scatter(
-        drives_df,
-        x = drive_x,
-        y = drive_y,
-        hover_name = 'Tm',
-        hover_data = ['Year'],
-        title = 'Per Drive',
-        color = drive_x,
-        size = drive_y,
-        text = 'Tm',
-        color_continuous_scale=px.colors.sequential.Blackbody_r[0:2].append(px.colors.sequential.Blackbody_r[3])
-    )
-    drives_fig.update_layout(
-        plot_bgcolor = 'rgba(0, 0, 0, 0)',
-        paper_bgcolor = 'rgba(0, 0, 0, 0)',
-        font_color=colors['text']
-    )
-    drives_fig.add_hline(
-        y = merged_df_dict['drives'][drive_y][merged_df_dict['drives']['Year'] != 2021].mean(),
-        line_width=1, line_dash="dash",
-    )
-    drives_fig.add_vline(
-        x = merged_df_dict['drives'][drive_x][merged_df_dict['drives']['Year'] != 2021].mean(),
-        line_width=1, line_dash="dash",
-    )
-    dff = merged_df_dict['drives'][merged_df_dict['drives']['Year'] != 2021]
-    drives_fig.update_xaxes(range=[dff[drive_x].min(), dff[drive_x].max()])
-    drives_fig.update_yaxes(range=[dff[drive_y].min(), dff[drive_y].max()])
-    #plot 4 - Team Stats
-    df = merged_df_dict['team_stats'].set_index(['Tm','Year'])
-    team_stats_df = df.loc[[(team_1_name, year_1), (team_2_name, year_2)]].reset_index()
-    team_stats_fig = px.scatter(
-        team_stats_df,
-        x = ov_x,
-        y = ov_y,
-        hover_name = 'Tm',
-        hover_data = ['Year'],
-        title = 'Overall Team Stats',
-        color = ov_x,
-        size = ov_y,
-        text = 'Tm',
-        color_continuous_scale=px.colors.sequential.Blackbody_r[0:2].append(px.colors.sequential.Blackbody_r[3])
-    )
-    team_stats_fig.update_layout(
-        plot_bgcolor = 'rgba(0, 0, 0, 0)',
-        paper_bgcolor = 'rgba(0, 0, 0, 0)',
-        font_color=colors['text']
-    )
-    team_stats_fig.add_hline(
-        y = merged_df_dict['team_stats'][merged_df_dict['team_stats']['Year'] != 2021][ov_y].mean(),
-        line_width=1, line_dash="dash",
-    )
-    team_stats_fig.add_vline(
-        x = merged_df_dict['team_stats'][merged_df_dict['team_stats']['Year'] != 2021][ov_x].mean(),
-        line_width=1, line_dash="dash",
-    )
-    dff = merged_df_dict['team_stats'][merged_df_dict['team_stats']['Year'] != 2021]
-    team_stats_fig.update_xaxes(range=[dff[ov_x].min(), dff[ov_x].max()])
-    team_stats_fig.update_yaxes(range=[dff[ov_y].min(), dff[ov_y].max()])
+@figure_cache.cached(normalize_compare_inputs)
+def update_compare_figures(teams, pass_x, pass_y, rush_x, rush_y, drive_x, drive_y, ov_x, ov_y, n_clicks, datatable_category):
+    snap = snapshots.current()
+    #the chosen teams' rows of every table on the page in one batch of indexed lookups
+    keys = [compare_key(value) for value in teams or []]
+    compare_dfs = snap.query.rows_many('merged', dict.fromkeys(['passing', 'rushing', 'drives', 'team_stats', datatable_category]), keys)
+    pass_fig = compare_figure(snap, compare_dfs['passing'], 'passing', pass_x, pass_y, 'Passing')
+    rush_fig = compare_figure(snap, compare_dfs['rushing'], 'rushing', rush_x, rush_y, 'Rushing')
+    drives_fig = compare_figure(snap, compare_dfs['drives'], 'drives', drive_x, drive_y, 'Per Drive')
+    team_stats_fig = compare_figure(snap, compare_dfs['team_stats'], 'team_stats', ov_x, ov_y, 'Overall Team Stats')
 
     #dataframe columns
-    df = merged_df_dict[datatable_category].set_index(['Tm','Year'])
-    table_df = df.loc[[(team_1_name, year_1), (team_2_name, year_2)]].reset_index()
-    table_df = table_df.drop("Unnamed: 0",axis=1)
+    table_df = schema.display_frame(compare_dfs[datatable_category].drop(columns = schema.internal_columns, errors = 'ignore'))
     columns = [{"name": i, "id": i} for i in table_df.columns]
     data = table_df.to_dict('records')
 
@@ -1149,6 +1057,30 @@ def update_compare_figures(year_1, year_2, team_1_name, team_2_name, pass_x, pas
 
 
 server = app.server
+
+#callback responses are compressed when the browser accepts brotli or gzip, and their sizes counted
+payload_log = payloads.PayloadLog(log = log_payloads)
+payloads.install(server, payload_log)
+
+warmer = warmup.Warmup(
+    {'update_graph' : update_graph, 'update_compare_figures' : update_compare_figures, 'pop_search_dropdown' : pop_search_dropdown},
+    snapshots,
+    traffic_log = traffic_log,
+    recorded = warmup_recorded
+)
+if not warmup_enabled:
+    warmer.skip()
+
+#ready once the worker has run its warm-up, load balancers and deploy checks wait on it
+@server.route('/ready')
+def ready():
+    return flask.jsonify(warmer.stats()), 200 if warmer.ready() else 503
+
+#data version, hit/miss counters for the lazily loaded tables, reload count, callback response sizes
+#and figure cache hit rate
+@server.route('/stats')
+def stats():
+    return flask.jsonify(dict(snapshots.stats(), payloads = payload_log.stats(), figure_cache = figure_cache.stats(), warmup = warmer.stats()))
 """
 if __name__ == '__main__': 
     app.run_server(debug = False)
@@ -0,0 +1,237 @@
+import os
+import glob
+import json
+import stat
+import pickle
+import hashlib
+import tempfile
+import functools
+import threading
+from collections import OrderedDict
+import numpy as np
+
+"""In-process cache of callback results. A callback's inputs are normalized, e.g. years sorted and
+slider bounds rounded, so the ways a browser can ask for the same view share one entry, and the
+callback is called with the normalized inputs so a cached result is exactly what it would return.
+Entries are evicted least recently used first once their estimated size passes max_bytes, and
+dropped whole when the data version changes. Behind it a SharedCache keeps results in files every
+worker on the host reads and writes, so a view drawn by one worker is a hit for the others"""
+
+#hashable key of a callback's normalized inputs
+def cache_key(name, args):
+    return json.dumps([name, args], default = str)
+
+#rough size in bytes of a callback result: numpy buffers, strings and the containers holding them.
+#object arrays are counted at a fixed size per item rather than walked
+def sizeof(value):
+    if isinstance(value, np.ndarray):
+        return value.size * 64 if value.dtype == object else value.nbytes
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof(item) for item in value) + 8 * len(value)
+    return 8
+
+#hash of the app's modules, part of the shared cache's salt so results drawn by older code aren't
+#served after a deploy, the cache directory outlives restarts
+def code_version(path = os.path.dirname(os.path.abspath(__file__))):
+    digest = hashlib.sha1()
+    for module in sorted(glob.glob(os.path.join(path, '*.py'))):
+        with open(module, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+#the files in the shared cache are unpickled, which runs code, so its directory has to be one only
+#this user can write to. it is made private, and one someone else made first at the same path,
+#e.g. in a shared /tmp, or a link in its place is refused
+def private_directory(path):
+    os.makedirs(path, mode = 0o700, exist_ok = True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError('{} is not a directory owned by this user'.format(path))
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+#callback results pickled into a directory shared by the workers of a host. file names start with
+#the data version, so another version's results are never read and are the first evicted, and hold
+#a hash of the key salted with the settings the results depend on. files are written beside their
+#final name and renamed over it, so a reader sees a whole file or none. once the directory passes
+#max_bytes the least recently read files are removed. raises PermissionError when path isn't private
+class SharedCache:
+    def __init__(self, path, max_bytes = 256 * 2 ** 20, salt = ''):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        private_directory(path)
+
+    def file_path(self, version, key):
+        digest = hashlib.sha1((self.salt + key).encode()).hexdigest()
+        return os.path.join(self.path, '{}-{}.pickle'.format(version, digest))
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, version, key):
+        path = self.file_path(version, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.count('misses')
+            return None
+        #a read marks the file recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.count('hits')
+        return value
+
+    def put(self, version, key, value):
+        path = self.file_path(version, key)
+        fd, tmp_path = tempfile.mkstemp(dir = self.path, suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.count('writes')
+        self.evict(version)
+
+    #remove files of other versions, then the least recently read, until the directory fits max_bytes
+    def evict(self, version):
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pickle'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.name.startswith(version + '-'), stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for current, mtime, size, path in files)
+        for current, mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.count('evictions')
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'path' : self.path,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'hit_rate' : round(self.hits / lookups, 3) if lookups else None,
+            'writes' : self.writes,
+            'evictions' : self.evictions,
+            'max_bytes' : self.max_bytes
+        }
+
+#in-process tier, with shared as the tier behind it when given. recorder is told every call's
+#normalized inputs, see warmup.TrafficLog
+class FigureCache:
+    def __init__(self, version, max_bytes = 64 * 2 ** 20, shared = None, recorder = None):
+        self.version = version
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.recorder = recorder
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    #drop every entry when the data version moved on, called holding the lock
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key):
+        version = self.version()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return version, None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return version, entry[0]
+
+    #results computed on a version that has since been replaced aren't kept
+    def put(self, version, key, value):
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last = False)[1][1]
+                self.evictions += 1
+
+    #decorator caching a callback on the inputs normalize returns, as a list of its arguments
+    def cached(self, normalize):
+        def decorator(f):
+            @functools.wraps(f)
+            def wrapper(*args):
+                args = normalize(*args)
+                if self.recorder is not None:
+                    self.recorder.record(f.__name__, args)
+                if not self.max_bytes and self.shared is None:
+                    return f(*args)
+                key = cache_key(f.__name__, args)
+                version, value = self.get(key)
+                if value is None and self.shared is not None:
+                    value = self.shared.get(version, key)
+                    if value is not None:
+                        self.put(version, key, value)
+                if value is None:
+                    value = f(*args)
+                    self.put(version, key, value)
+                    if self.shared is not None and value is not None:
+                        self.shared.put(version, key, value)
+                return value
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_rate' : round(self.hits / lookups, 3) if lookups else None,
+                'evictions' : self.evictions,
+                'invalidations' : self.invalidations,
+                'entries' : len(self._entries),
+                'bytes' : self._bytes,
+                'max_bytes' : self.max_bytes,
+                'shared' : None if self.shared is None else self.shared.stats()
+            }
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+import plotly.colors
+import plotly.io as pio
+import schema
+
+"""Scatter figures assembled as plain trace and layout dicts from the columns of a frame, in place
+of plotly express. px.scatter introspects and copies the frame and validates the whole figure on
+every call, and the callbacks only ever draw one kind of scatter, so it is built here directly
+from numpy arrays on a layout template made once at import"""
+
+#what px.scatter draws with when it isn't given a color, a colorscale or a size limit
+default_color = plotly.colors.qualitative.Plotly[0]
+discrete_colors = plotly.colors.qualitative.Plotly
+color_scale = plotly.colors.make_colorscale(plotly.colors.sequential.Plasma)
+size_max = 20
+#scatters of more points than this are drawn with webgl, the default is where px.scatter switches
+webgl_points = 1000
+#rows kept from each end of every plotted column when a scatter is thinned
+extreme_points = 25
+#bins along each axis of a density view
+density_bins = 60
+highlight_color = plotly.colors.sequential.Blackbody_r[3]
+
+#the parts of the default plotly template a scatter uses, px sends the whole template with every figure
+def plotly_template():
+    layout = pio.templates['plotly'].layout.to_plotly_json()
+    data = pio.templates['plotly'].data.to_plotly_json()
+    return {
+        'layout' : {key : layout[key] for key in ['xaxis', 'yaxis', 'coloraxis', 'colorscale', 'colorway', 'hoverlabel', 'hovermode', 'title', 'font']},
+        'data' : {key : data[key] for key in ['scatter', 'scattergl']}
+    }
+
+#layout every figure starts from: transparent backgrounds and the app's text color
+def layout_template(font_color, **layout):
+    template = {
+        'template' : plotly_template(),
+        'plot_bgcolor' : 'rgba(0, 0, 0, 0)',
+        'paper_bgcolor' : 'rgba(0, 0, 0, 0)',
+        'font' : {'color' : font_color},
+        'margin' : {'t' : 60},
+    }
+    template.update(layout)
+    return template
+
+def figure(template, title = None, x_title = None, y_title = None):
+    layout = dict(template)
+    layout['xaxis'] = {'anchor' : 'y', 'domain' : [0.0, 1.0], 'title' : {'text' : x_title}}
+    layout['yaxis'] = {'anchor' : 'x', 'domain' : [0.0, 1.0], 'title' : {'text' : y_title}}
+    layout['legend'] = {'tracegroupgap' : 0}
+    if title is not None:
+        layout['title'] = {'text' : title}
+    return {'data' : [], 'layout' : layout}
+
+#an empty figure on the template, what the graphs show before anything is selected
+def blank(template):
+    return figure(template)
+
+#values of a column for a trace, categoricals come out as objects. floats are rounded to the
+#decimals the app displays, plotly's encoder writes every digit of a float otherwise
+def values(df, col):
+    return compact(df[col].to_numpy())
+
+def compact(array):
+    if array.dtype.kind in ['f']:
+        return array.round(schema.display_decimals)
+    return array
+
+def compact_value(value):
+    return round(float(value), schema.display_decimals)
+
+def is_continuous(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+#hover lines in the order px.scatter writes them. the point labels aren't repeated, they are a
+#part of the hover name, and hover columns with one value in constants are written into the template
+def hover_template(x, y, hover_name = None, hover_data = (), color = None, size = None, group = None, constants = {}):
+    lines = [] if group is None else ['{}={}'.format(*group)]
+    lines += ['{}=%{{x}}'.format(x), '{}=%{{y}}'.format(y)]
+    if color is not None:
+        lines.append('{}=%{{marker.color}}'.format(color))
+    if size is not None and size != color:
+        lines.append('{}=%{{marker.size}}'.format(size))
+    customdata = [col for col in hover_data if col not in constants]
+    for col in hover_data:
+        if col in constants:
+            lines.append('{}={}'.format(col, '' if pd.isna(constants[col]) else constants[col]))
+        else:
+            lines.append('{}=%{{customdata[{}]}}'.format(col, customdata.index(col)))
+    head = '' if hover_name is None else '<b>%{hovertext}</b><br><br>'
+    return head + '<br>'.join(lines) + '<extra></extra>'
+
+#scatter of x against y with px.scatter's hover, color and size, a trace per value of a color
+#column that isn't numeric
+def scatter(df, x, y, template, title = None, hover_name = None, hover_data = (), color = None, size = None, text = None, webgl = None):
+    fig = figure(template, title, x, y)
+    type = trace_type(df) if webgl is None else ('scattergl' if webgl else 'scatter')
+    hover_data = [col for col in hover_data if col not in [x, y, hover_name]]
+    if size is not None and not is_continuous(df[size]):
+        size = None
+    marker = {'symbol' : 'circle'}
+    if size is not None:
+        sizes = values(df, size)
+        max_size = np.nanmax(sizes) if np.isfinite(sizes.astype(float)).any() else 1
+        marker.update({'size' : sizes, 'sizemode' : 'area', 'sizeref' : 2.0 * float(max_size) / (size_max ** 2)})
+        fig['layout']['legend']['itemsizing'] = 'constant'
+    if color is not None and not is_continuous(df[color]):
+        codes, groups = pd.factorize(df[color])
+        groups = list(groups)
+        #rows without a value are a group of their own, after the others as px.scatter draws them
+        if (codes < 0).any():
+            codes = np.where(codes < 0, len(groups), codes)
+            groups.append(np.nan)
+        for i, group in enumerate(groups):
+            rows = np.flatnonzero(codes == i)
+            group_marker = dict(marker, color = discrete_colors[i % len(discrete_colors)])
+            if size is not None:
+                group_marker['size'] = marker['size'][rows]
+            trace = scatter_trace(df.iloc[rows], x, y, group_marker, hover_name, hover_data, None, size, text, (color, group), type)
+            trace.update({'name' : str(group), 'legendgroup' : str(group), 'showlegend' : True})
+            fig['data'].append(trace)
+        fig['layout']['legend']['title'] = {'text' : color}
+        return fig
+    if color is not None:
+        marker.update({'color' : values(df, color), 'coloraxis' : 'coloraxis'})
+        fig['layout']['coloraxis'] = {'colorbar' : {'title' : {'text' : color}}, 'colorscale' : color_scale}
+    else:
+        marker['color'] = default_color
+    fig['data'].append(scatter_trace(df, x, y, marker, hover_name, hover_data, color, size, text, type = type))
+    return fig
+
+def trace_type(df):
+    return 'scattergl' if len(df) > webgl_points else 'scatter'
+
+#a trace of rows of a scatter, type is decided on the size of the whole figure
+def scatter_trace(df, x, y, marker, hover_name = None, hover_data = (), color = None, size = None, text = None, group = None, type = 'scatter'):
+    trace = {
+        'type' : type,
+        'x' : values(df, x),
+        'y' : values(df, y),
+        'mode' : 'markers' if text is None else 'markers+text',
+        'marker' : marker,
+        'name' : '',
+        'showlegend' : False,
+    }
+    #a hover column with the same value on every point, e.g. Year in a single season view, is sent once
+    constants = {col : df[col].iloc[0] for col in hover_data if len(df) and df[col].nunique(dropna = False) == 1}
+    trace['hovertemplate'] = hover_template(x, y, hover_name, hover_data, color, size, group, constants)
+    if hover_name is not None:
+        trace['hovertext'] = values(df, hover_name)
+    customdata = [col for col in hover_data if col not in constants]
+    if customdata:
+        trace['customdata'] = df[customdata].astype(object).to_numpy()
+    if text is not None:
+        trace['text'] = values(df, text)
+    return trace
+
+#positions of at most budget rows of df to draw: the extreme_points smallest and largest values of
+#each column, the rows in keep, e.g. searched names, and rows spread evenly over the rest
+def thin_positions(df, budget, columns, keep = ()):
+    kept = [np.asarray(keep, dtype = np.int64)]
+    for col in dict.fromkeys(col for col in columns if col is not None):
+        if not is_continuous(df[col]):
+            continue
+        column = df[col].to_numpy(dtype = 'float64', na_value = np.nan)
+        order = np.flatnonzero(~np.isnan(column))
+        order = order[np.argsort(column[order], kind = 'stable')]
+        kept += [order[:extreme_points], order[-extreme_points:]]
+    kept = np.unique(np.concatenate(kept))
+    rest = np.setdiff1d(np.arange(len(df)), kept, assume_unique = True)
+    spread = max(budget - len(kept), 0)
+    if spread < len(rest):
+        rest = rest[np.linspace(0, len(rest) - 1, spread).astype(np.int64)] if spread else rest[:0]
+    return np.union1d(kept, rest)
+
+#2d histogram of x against y over the rows where both are set, with empty bins left blank, and
+#the rows of overlay, e.g. the extremes from thin_positions, drawn over it. the grid is sent as its
+#first bin and bin width plus the counts, so the figure's size depends on the bins rather than the rows
+def density(df, x, y, template, title = None, overlay = None, hover_name = None, hover_data = (), bins = density_bins):
+    fig = figure(template, title, x, y)
+    x_values = df[x].to_numpy(dtype = 'float64', na_value = np.nan)
+    y_values = df[y].to_numpy(dtype = 'float64', na_value = np.nan)
+    valid = ~(np.isnan(x_values) | np.isnan(y_values))
+    counts, x_edges, y_edges = np.histogram2d(x_values[valid], y_values[valid], bins = bins)
+    fig['data'].append({
+        'type' : 'heatmap',
+        'x0' : compact_value(x_edges[:2].mean()),
+        'dx' : compact_value(x_edges[1] - x_edges[0]),
+        'y0' : compact_value(y_edges[:2].mean()),
+        'dy' : compact_value(y_edges[1] - y_edges[0]),
+        'z' : np.where(counts.T > 0, counts.T, np.nan),
+        'coloraxis' : 'coloraxis',
+        'hovertemplate' : '{}=%{{x}}<br>{}=%{{y}}<br>rows=%{{z}}<extra></extra>'.format(x, y),
+    })
+    fig['layout']['coloraxis'] = {'colorbar' : {'title' : {'text' : 'rows'}}, 'colorscale' : color_scale}
+    if overlay is not None:
+        hover_data = [col for col in hover_data if col not in [x, y, hover_name]]
+        marker = {'symbol' : 'circle', 'color' : default_color, 'line' : {'width' : 1, 'color' : 'white'}}
+        fig['data'].append(scatter_trace(overlay, x, y, marker, hover_name, hover_data))
+    return fig
+
+#open circles labelled with their names over the rows of searched players or teams
+def highlight_trace(df, x, y, name):
+    return {
+        'type' : 'scatter',
+        'x' : values(df, x),
+        'y' : values(df, y),
+        'mode' : 'markers+text',
+        'text' : values(df, name),
+        'textposition' : 'top center',
+        'textfont' : {'color' : highlight_color, 'size' : 14},
+        'marker' : {'symbol' : 'circle-open', 'size' : 16, 'line' : {'width' : 3}, 'color' : highlight_color},
+        'hoverinfo' : 'skip',
+        'showlegend' : False,
+    }
+
+def add_trace(fig, trace):
+    fig['data'].append(trace)
+    return fig
+
+#dashed lines across the plot at x and y, as add_vline and add_hline draw them
+def add_mean_lines(fig, x = None, y = None):
+    shapes = fig['layout'].setdefault('shapes', [])
+    line = {'dash' : 'dash', 'width' : 1}
+    if y is not None and not pd.isna(y):
+        shapes.append({'type' : 'line', 'line' : line, 'x0' : 0, 'x1' : 1, 'xref' : 'x domain', 'y0' : compact_value(y), 'y1' : compact_value(y), 'yref' : 'y'})
+    if x is not None and not pd.isna(x):
+        shapes.append({'type' : 'line', 'line' : line, 'x0' : compact_value(x), 'x1' : compact_value(x), 'xref' : 'x', 'y0' : 0, 'y1' : 1, 'yref' : 'y domain'})
+    return fig
+
+def set_ranges(fig, x = None, y = None):
+    if x is not None:
+        fig['layout']['xaxis']['range'] = list(x)
+    if y is not None:
+        fig['layout']['yaxis']['range'] = list(y)
+    return fig
@@ -0,0 +1,87 @@
+import threading
+import numpy as np
+import store
+
+"""Range filtering for update_graph. The season and axis range predicates are evaluated together
+over the table's columns and give the positions of the matching rows, so the only frame built is
+the one taken from those positions. Each range filtered column gets a sorted index the first time
+it is filtered, and searchsorted over it counts the rows in a range, so the most selective of the
+season and range predicates picks the candidate rows and the others are checked on those alone"""
+
+#bounds compare in the column's dtype, so a float32 column is filtered on the same values it shows
+def typed_bound(values, bound):
+    if np.issubdtype(values.dtype, np.floating):
+        return values.dtype.type(bound)
+    return bound
+
+#rows of a column in ascending order of value, missing values last
+def sorted_index(values):
+    order = np.argsort(values, kind = 'stable')
+    return order, values[order]
+
+def in_range(values, low, high):
+    return (values >= typed_bound(values, low)) & (values <= typed_bound(values, high))
+
+#rows of a frame with every (col, low, high) of ranges in range, for columns joined onto a view
+def filter_ranges(df, ranges):
+    mask = np.ones(len(df), dtype = bool)
+    for col, low, high in ranges:
+        mask &= in_range(df[col].to_numpy(), low, high)
+    return df[mask]
+
+class FilterEngine:
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    #sorted index of a table's column, keyed by the table so it is built once per snapshot
+    def column_index(self, key, df, col):
+        index = self._indexes.get((key, col))
+        if index is None:
+            index = sorted_index(df[col].to_numpy())
+            with self._lock:
+                self._indexes[(key, col)] = index
+        return index
+
+    #ascending positions of the rows of df in years with every (col, low, high) of ranges in range
+    def positions(self, key, df, years, ranges):
+        slices = store.year_slices(df, years)
+        year_rows = sum(stop - start for start, stop in slices)
+        columns = {col : df[col].to_numpy() for col, low, high in ranges}
+
+        #rows each range would select, from its sorted index
+        best, best_bounds, best_rows = None, None, year_rows
+        for i, (col, low, high) in enumerate(ranges):
+            order, sorted_values = self.column_index(key, df, col)
+            first = np.searchsorted(sorted_values, typed_bound(sorted_values, low), 'left')
+            last = np.searchsorted(sorted_values, typed_bound(sorted_values, high), 'right')
+            if last - first < best_rows:
+                best, best_bounds, best_rows = i, (first, last), last - first
+
+        if best is None:
+            #the seasons are the narrowest predicate, check the ranges over their contiguous slices
+            positions = []
+            for start, stop in slices:
+                mask = np.ones(stop - start, dtype = bool)
+                for col, low, high in ranges:
+                    mask &= in_range(columns[col][start:stop], low, high)
+                positions.append(np.flatnonzero(mask) + start)
+            return np.concatenate(positions) if positions else np.empty(0, dtype = np.int64)
+
+        order, sorted_values = self.column_index(key, df, ranges[best][0])
+        candidates = np.sort(order[best_bounds[0]:best_bounds[1]])
+        mask = np.zeros(len(candidates), dtype = bool)
+        for start, stop in slices:
+            mask |= (candidates >= start) & (candidates < stop)
+        for i, (col, low, high) in enumerate(ranges):
+            if i != best:
+                mask &= in_range(columns[col][candidates], low, high)
+        return candidates[mask]
+
+#positions of the rows of a name column holding any of names, in one pass over the column however
+#many names there are. categorical columns are matched on their codes
+def name_positions(series, names):
+    if hasattr(series, 'cat'):
+        codes = series.cat.categories.get_indexer(list(names))
+        return np.flatnonzero(np.isin(series.cat.codes.to_numpy(), codes[codes >= 0]))
+    return np.flatnonzero(series.isin(list(names)).to_numpy())
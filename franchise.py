@@ -0,0 +1,122 @@
+import threading
+import numpy as np
+import pandas as pd
+import store
+
+"""Franchise dimension for the team tables. Team tables name a team by its display name in Tm,
+which changes when a franchise relocates or is renamed (San Diego to Los Angeles Chargers,
+St. Louis to Los Angeles Rams, Oakland to Las Vegas Raiders, Washington), so every (Tm, Year)
+is mapped to a franchise id and the abbreviations Pro Football Reference and Football
+Outsiders use for it that season. Built at ingest, and from the team store when missing"""
+
+#csv path the franchise table's columnar copies are kept under, there is no csv
+franchise_table_path = r'data/teams/franchises.csv'
+
+#franchise id: [(first season, display name, reference abbreviation, football outsiders abbreviation)],
+#a name is used from its first season until the next entry's
+franchises = {
+    'cardinals' : [(1994, 'Arizona Cardinals', 'ARI', 'ARI')],
+    'falcons' : [(1966, 'Atlanta Falcons', 'ATL', 'ATL')],
+    'ravens' : [(1996, 'Baltimore Ravens', 'BAL', 'BAL')],
+    'bills' : [(1960, 'Buffalo Bills', 'BUF', 'BUF')],
+    'panthers' : [(1995, 'Carolina Panthers', 'CAR', 'CAR')],
+    'bears' : [(1922, 'Chicago Bears', 'CHI', 'CHI')],
+    'bengals' : [(1968, 'Cincinnati Bengals', 'CIN', 'CIN')],
+    'browns' : [(1999, 'Cleveland Browns', 'CLE', 'CLE')],
+    'cowboys' : [(1960, 'Dallas Cowboys', 'DAL', 'DAL')],
+    'broncos' : [(1960, 'Denver Broncos', 'DEN', 'DEN')],
+    'lions' : [(1934, 'Detroit Lions', 'DET', 'DET')],
+    'packers' : [(1921, 'Green Bay Packers', 'GNB', 'GB')],
+    'texans' : [(2002, 'Houston Texans', 'HOU', 'HOU')],
+    'colts' : [(1984, 'Indianapolis Colts', 'IND', 'IND')],
+    'jaguars' : [(1995, 'Jacksonville Jaguars', 'JAX', 'JAX')],
+    'chiefs' : [(1963, 'Kansas City Chiefs', 'KAN', 'KC')],
+    'chargers' : [(1961, 'San Diego Chargers', 'SDG', 'SD'), (2017, 'Los Angeles Chargers', 'LAC', 'LAC')],
+    'rams' : [(1995, 'St. Louis Rams', 'STL', 'STL'), (2016, 'Los Angeles Rams', 'LAR', 'LAR')],
+    'raiders' : [(1995, 'Oakland Raiders', 'OAK', 'OAK'), (2020, 'Las Vegas Raiders', 'LVR', 'LV')],
+    'dolphins' : [(1966, 'Miami Dolphins', 'MIA', 'MIA')],
+    'vikings' : [(1961, 'Minnesota Vikings', 'MIN', 'MIN')],
+    'patriots' : [(1971, 'New England Patriots', 'NWE', 'NE')],
+    'saints' : [(1967, 'New Orleans Saints', 'NOR', 'NO')],
+    'giants' : [(1925, 'New York Giants', 'NYG', 'NYG')],
+    'jets' : [(1963, 'New York Jets', 'NYJ', 'NYJ')],
+    'eagles' : [(1933, 'Philadelphia Eagles', 'PHI', 'PHI')],
+    'steelers' : [(1945, 'Pittsburgh Steelers', 'PIT', 'PIT')],
+    'niners' : [(1946, 'San Francisco 49ers', 'SFO', 'SF')],
+    'seahawks' : [(1976, 'Seattle Seahawks', 'SEA', 'SEA')],
+    'buccaneers' : [(1976, 'Tampa Bay Buccaneers', 'TAM', 'TB')],
+    'titans' : [(1999, 'Tennessee Titans', 'TEN', 'TEN')],
+    'washington' : [(1937, 'Washington Redskins', 'WAS', 'WAS'), (2020, 'Washington Football Team', 'WAS', 'WAS')],
+}
+
+#display name to franchise id, names are never reused by another franchise
+franchise_ids = {name : franchise_id for franchise_id, names in franchises.items() for first, name, abbreviation, dvoa in names}
+
+#the franchise entry in force in a season
+def franchise_entry(franchise_id, year):
+    entries = [entry for entry in franchises[franchise_id] if entry[0] <= year]
+    return entries[-1] if entries else franchises[franchise_id][0]
+
+#a row per (Tm, Year) of the team store with its franchise id and abbreviations
+def build_franchise_table(store_df = None):
+    if store_df is None:
+        store_df = store.read_team_store('team_stats')
+    keys = store_df[['Tm', 'Year']].drop_duplicates().sort_values(['Year', 'Tm']).reset_index(drop = True)
+    rows = []
+    for tm, year in zip(keys['Tm'], keys['Year']):
+        franchise_id = franchise_ids.get(tm)
+        if franchise_id is None:
+            raise KeyError('No franchise for {} in {}, add it to franchise.franchises'.format(tm, year))
+        first, name, abbreviation, dvoa = franchise_entry(franchise_id, int(year))
+        rows.append({'Tm' : tm, 'Year' : int(year), 'franchise' : franchise_id, 'abbreviation' : abbreviation, 'dvoa_team' : dvoa})
+    return pd.DataFrame(rows, columns = ['Tm', 'Year', 'franchise', 'abbreviation', 'dvoa_team'])
+
+def write_franchise_table():
+    df = build_franchise_table()
+    store.write_columnar_copies(df, franchise_table_path)
+    return df
+
+def read_franchise_table():
+    return store.read_table(franchise_table_path, fallback = build_franchise_table)
+
+#merged team table with the franchise id and abbreviation of each row. a (Tm, Year) franchise_df
+#doesn't have, e.g. a season scraped after it was written, is looked up in a table built from
+#the rows themselves, which raises for a team franchises doesn't name
+def assign_franchises(df, franchise_df):
+    if 'franchise' in df.columns:
+        return df
+    keys = pd.MultiIndex.from_arrays([df['Tm'].astype(object), df['Year'].astype('int64')])
+    lookup = franchise_df.set_index(['Tm', 'Year'])
+    positions = lookup.index.get_indexer(keys)
+    if (positions < 0).any():
+        lookup = build_franchise_table(df[['Tm', 'Year']]).set_index(['Tm', 'Year'])
+        positions = lookup.index.get_indexer(keys)
+    return df.assign(
+        franchise = lookup['franchise'].astype(object).to_numpy()[positions],
+        abbreviation = lookup['abbreviation'].astype(object).to_numpy()[positions]
+    )
+
+#rows of each franchise in a team table, by position, built once per table
+class FranchiseIndex:
+    def __init__(self, df_dict):
+        self.df_dict = df_dict
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def positions(self, table_id):
+        positions = self._positions.get(table_id)
+        if positions is None:
+            positions = {franchise_id : rows for franchise_id, rows in self.df_dict[table_id].groupby('franchise', observed = True).indices.items()}
+            with self._lock:
+                self._positions[table_id] = positions
+        return positions
+
+    #seasons of franchises in a team table under every name they played as, in table order
+    def history(self, table_id, franchise_ids, years = None):
+        positions = self.positions(table_id)
+        rows = [positions[franchise_id] for franchise_id in franchise_ids if franchise_id in positions]
+        df = self.df_dict[table_id]
+        df = df.iloc[np.sort(np.concatenate(rows)) if rows else []]
+        if years is not None:
+            df = df[df['Year'].isin(years)]
+        return df
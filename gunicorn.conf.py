@@ -0,0 +1,19 @@
+import os
+
+#gunicorn reads this file from the working directory, so it applies to the Procfile's gunicorn app:server
+
+#threads per worker, above 1 gunicorn runs threaded workers in place of sync ones. the loaded tables
+#are frozen and the callbacks only read them, check a change with python stress.py before raising it
+threads = int(os.environ.get('NFL_PYPLOT_THREADS', 1))
+
+#each worker warms its caches before it takes requests, with the worker's heartbeat passed along so
+#gunicorn doesn't time it out while it does. app is already loaded by the worker at this point
+def post_worker_init(worker):
+    import app
+    if not app.warmer.ready():
+        app.warmer.run(notify = worker.notify)
+
+#the inputs this worker was asked for since its traffic log last flushed are written before it exits
+def worker_exit(server, worker):
+    import app
+    app.traffic_log.flush()
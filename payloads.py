@@ -0,0 +1,68 @@
+import threading
+import flask
+
+#flask-compress is optional, without it callback responses are sent uncompressed
+try:
+    from flask_compress import Compress
+    HAS_COMPRESS = True
+except ImportError:
+    HAS_COMPRESS = False
+
+"""Compression and size accounting for callback responses. Responses of the callback route are
+compressed with brotli or gzip, whichever the browser accepts first, and the size of each one
+before and after compression is counted per callback output, printed when log is on and
+reported on /stats"""
+
+#the route dash posts every callback to
+update_path = '/_dash-update-component'
+
+#brotli first, at a quality that compresses a large scatter as small as gzip does in less time
+compress_algorithms = ['br', 'gzip']
+brotli_level = 5
+
+class PayloadLog:
+    def __init__(self, log = True):
+        self.log = log
+        self._outputs = {}
+        self._lock = threading.Lock()
+
+    def record(self, output, size, sent, encoding):
+        with self._lock:
+            counts = self._outputs.setdefault(output, {'calls' : 0, 'bytes' : 0, 'sent' : 0, 'max_bytes' : 0})
+            counts['calls'] += 1
+            counts['bytes'] += size
+            counts['sent'] += sent
+            counts['max_bytes'] = max(counts['max_bytes'], size)
+        if self.log:
+            print('{}: {:,} bytes, {:,} sent {}'.format(output, size, sent, encoding))
+
+    #calls and mean bytes per callback output, before and after compression
+    def stats(self):
+        with self._lock:
+            return {
+                output : dict(counts, mean_bytes = counts['bytes'] // counts['calls'], mean_sent = counts['sent'] // counts['calls'])
+                for output, counts in self._outputs.items()
+            }
+
+#compress the callback responses of server and count their sizes in payload_log. other routes,
+#e.g. the layout and assets, are left to the defaults
+def install(server, payload_log):
+    compress = None
+    if HAS_COMPRESS:
+        server.config['COMPRESS_ALGORITHM'] = compress_algorithms
+        server.config['COMPRESS_BR_LEVEL'] = brotli_level
+        server.config['COMPRESS_REGISTER'] = False
+        compress = Compress(server)
+
+    @server.after_request
+    def compress_update(response):
+        if not flask.request.path.endswith(update_path) or response.direct_passthrough:
+            return response
+        size = response.content_length or 0
+        if compress is not None:
+            response = compress.after_request(response)
+        request = flask.request.get_json(silent = True) or {}
+        payload_log.record(request.get('output', 'unknown'), size, response.content_length or 0, response.headers.get('Content-Encoding', 'identity'))
+        return response
+
+    return compress
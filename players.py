@@ -0,0 +1,114 @@
+import threading
+import numpy as np
+import pandas as pd
+import store
+
+"""Index joining the player tables on (player_id, Year, Tm), see store.player_ids for the ids.
+The index has a row per key with the row each category holds for it, so a column of another
+category is looked up for the rows of a view without merging the tables"""
+
+join_keys = ['player_id', 'Year', 'Tm']
+
+#csv path the join index's columnar copies are kept under, there is no csv
+join_index_path = r'data/players/player_index.csv'
+
+#separator between category and column in the columns update_graph takes from another category
+column_separator = ':'
+
+#row position of each (player_id, Year, Tm) key in every player table, -1 where a table has no row
+def build_join_index(df_dict):
+    keys = pd.concat([df_dict[table_id][join_keys].astype(object) for table_id in df_dict], ignore_index = True)
+    keys = keys.drop_duplicates().sort_values(['Year', 'player_id', 'Tm'], kind = 'mergesort').reset_index(drop = True)
+    key_index = pd.MultiIndex.from_frame(keys)
+    index = keys.copy()
+    for table_id, df in df_dict.items():
+        rows = np.full(len(keys), -1, dtype = np.int32)
+        positions = key_index.get_indexer(pd.MultiIndex.from_frame(df[join_keys].astype(object)))
+        #a key repeated within a table keeps its first row
+        rows[positions[::-1]] = np.arange(len(df), dtype = np.int32)[::-1]
+        index[table_id] = rows
+    return index
+
+def write_join_index(df_dict):
+    index = build_join_index(df_dict)
+    store.write_columnar_copies(index, join_index_path)
+    return index
+
+def qualified_column(table_id, col):
+    return '{}{}{}'.format(table_id, column_separator, col)
+
+#(table_id, col) of a column update_graph was given, table_id is None for the selected category's own columns
+def split_column(col):
+    if col is not None and column_separator in col:
+        table_id, col = col.split(column_separator, 1)
+        return table_id, col
+    return None, col
+
+#positions in index of a column's values, -1 for values not in it. categoricals are looked up by category
+def codes_in(index, series):
+    if hasattr(series, 'cat'):
+        category_codes = np.append(index.get_indexer(series.cat.categories), -1)
+        return category_codes[series.cat.codes.to_numpy()]
+    return index.get_indexer(series)
+
+#joins a view of one player table to the columns of the others through the join index. keys are
+#looked up as one int64 per row, from the codes of the player id and team and the season.
+#tables, when given, is the store.PinnedTables the join index is read from
+class PlayerJoin:
+    def __init__(self, df_dict, index = None, tables = None):
+        self.df_dict = df_dict
+        self.index = index
+        self.tables = tables
+        self._codes = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._codes is not None:
+                return
+            if self.index is None:
+                read = store.read_table if self.tables is None else self.tables.read_table
+                self.index = read(join_index_path, fallback = lambda: build_join_index(self.df_dict))
+            self.player_ids = pd.Index(self.index['player_id'].astype(object).unique())
+            self.teams = pd.Index(self.index['Tm'].astype(object).unique())
+            codes = self.key_codes(self.index)
+            self._order = np.argsort(codes, kind = 'stable')
+            self._codes = codes[self._order]
+
+    def key_codes(self, df):
+        player_codes = codes_in(self.player_ids, df['player_id']).astype(np.int64)
+        team_codes = codes_in(self.teams, df['Tm']).astype(np.int64)
+        codes = (player_codes * len(self.teams) + team_codes) * 10000 + df['Year'].to_numpy().astype(np.int64)
+        return np.where((player_codes >= 0) & (team_codes >= 0), codes, -1)
+
+    #positions in the join index of the rows of df, -1 for rows without a key in it
+    def key_ids(self, df):
+        if self._codes is None:
+            self.load()
+        codes = self.key_codes(df)
+        found = np.searchsorted(self._codes, codes).clip(0, len(self._codes) - 1)
+        return np.where(self._codes[found] == codes, self._order[found], -1)
+
+    #values of table_id's col for each row of df, NaN where the player has no row in table_id that season and team
+    def lookup(self, df, table_id, col, key_ids = None):
+        if key_ids is None:
+            key_ids = self.key_ids(df)
+        rows = np.where(key_ids >= 0, self.index[table_id].to_numpy()[key_ids], -1)
+        values = self.df_dict[table_id][col].to_numpy()
+        #float32 stats stay float32 so they are rounded for display like the view's own columns
+        joined = np.full(len(df), np.nan, dtype = np.result_type(values.dtype, np.float32))
+        found = rows >= 0
+        joined[found] = values[rows[found]]
+        return joined
+
+    #df with a column named table_id:col for each of columns taken from another table
+    def attach(self, df, columns):
+        joined = {}
+        key_ids = None
+        for qualified in columns:
+            table_id, col = split_column(qualified)
+            if table_id is not None and qualified not in joined:
+                if key_ids is None:
+                    key_ids = self.key_ids(df)
+                joined[qualified] = self.lookup(df, table_id, col, key_ids)
+        return df.assign(**joined) if joined else df
@@ -0,0 +1,175 @@
+import os
+import glob
+import json
+import hashlib
+import threading
+import pandas as pd
+import schema
+import store
+import players
+
+"""Derived state the callbacks need: column option lists, seasons and teams per season,
+and league means, mins and maxes. Built offline into a versioned bundle by
+scrape/build_bundle.py and computed live per table when the bundle is missing or stale"""
+
+#bump when the layout of the bundle changes
+bundle_version = 3
+bundle_path = r'data/bundle.json'
+
+#seasons still in progress are left out of league means and ranges, NFL_PYPLOT_INCOMPLETE_SEASONS
+#takes a comma separated list of them and is empty once every season is complete
+incomplete_seasons = sorted(int(year) for year in os.environ.get('NFL_PYPLOT_INCOMPLETE_SEASONS', '2021').split(',') if year.strip())
+
+def completed_seasons(years):
+    return [year for year in years if year not in incomplete_seasons]
+
+#source files the bundle is built from, a change to any of them makes the bundle stale
+def data_files():
+    return sorted(glob.glob('data/players/*.csv') + glob.glob(os.path.join(store.team_store_dir, '*')))
+
+def data_fingerprint():
+    digest = hashlib.sha1()
+    for path in data_files():
+        digest.update(path.encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def column_options(type, df):
+    if type in ['merged']:
+        return [col for col in df.columns if col not in ['Tm','Rk'] + schema.internal_columns]
+    return [col for col in df.columns[3:] if col not in ['Pos','G','GS'] + schema.internal_columns]
+
+#min, max, mean and count of every stat in each season, so the range of a column over any set of
+#seasons is combined from these entries instead of filtering and scanning the table
+def year_stats(df, stat_columns):
+    stat_columns = [col for col in stat_columns if col not in ['Year']]
+    grouped = df[['Year'] + stat_columns].groupby('Year')
+    mins, maxes, counts = grouped.min(), grouped.max(), grouped.count()
+    means = df[stat_columns].astype('float64').groupby(df['Year']).mean()
+    stats = {}
+    for col in stat_columns:
+        stats[col] = {
+            str(int(year)) : [
+                schema.display_value(mins.at[year, col]),
+                schema.display_value(maxes.at[year, col]),
+                float(means.at[year, col]),
+                int(counts.at[year, col])
+            ]
+            for year in counts.index if counts.at[year, col] > 0
+        }
+    return stats
+
+#combine the per season entries of a column into the min, max, mean and count over years
+def combine_year_stats(col_stats, years):
+    entries = [col_stats[str(year)] for year in years if str(year) in col_stats]
+    if not entries:
+        return None
+    count = sum(entry[3] for entry in entries)
+    return {
+        'min' : min(entry[0] for entry in entries),
+        'max' : max(entry[1] for entry in entries),
+        'mean' : sum(entry[2] * entry[3] for entry in entries) / count,
+        'count' : count
+    }
+
+def table_artifacts(type, df):
+    years = sorted(int(year) for year in df['Year'].unique())
+    completed = store.select_years(df, completed_seasons(years))
+    stat_columns = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col]) and col not in ['Unnamed: 0']]
+    artifacts = {
+        'options' : column_options(type, df),
+        'years' : years,
+        'completed_seasons' : completed_seasons(years),
+        'league_mean' : {col : schema.display_value(completed[col].mean()) for col in stat_columns},
+        'league_min' : {col : schema.display_value(completed[col].min()) for col in stat_columns},
+        'league_max' : {col : schema.display_value(completed[col].max()) for col in stat_columns},
+        'year_stats' : year_stats(df, stat_columns),
+    }
+    if type in ['merged']:
+        #json keys are strings, so seasons are keyed by str(year)
+        artifacts['teams_by_year'] = {
+            str(year) : [str(team) for team in teams.unique()] for year, teams in df.groupby('Year')['Tm']
+        }
+    return artifacts
+
+def table_key(type, table_id):
+    return '{}/{}'.format(type, table_id)
+
+def compute_tables():
+    tables = {}
+    for type, table_ids in [('player', store.player_table_ids), ('merged', store.merged_table_ids)]:
+        for table_id in table_ids:
+            tables[table_key(type, table_id)] = table_artifacts(type, store.load_table(type, table_id))
+    return tables
+
+def write_bundle(tables, path = bundle_path):
+    bundle = {'version' : bundle_version, 'fingerprint' : data_fingerprint(), 'incomplete_seasons' : incomplete_seasons, 'tables' : tables}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(bundle, f)
+    os.replace(tmp_path, path)
+
+#tables of a bundle that matches this version of the app, the data on disk and the
+#configured incomplete seasons, else None
+def load_bundle(path = bundle_path):
+    try:
+        with open(path) as f:
+            bundle = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if bundle.get('version') != bundle_version or bundle.get('fingerprint') != data_fingerprint():
+        return None
+    if bundle.get('incomplete_seasons') != incomplete_seasons:
+        return None
+    return bundle['tables']
+
+#lookups into the bundle, computing a table's artifacts from its dataframe the first time
+#they are asked for when there is no usable bundle
+class Artifacts:
+    def __init__(self, df_dicts, tables = None):
+        self.df_dicts = df_dicts
+        self.from_bundle = tables is not None
+        self.tables = dict(tables or {})
+        self._lock = threading.Lock()
+
+    def table(self, type, table_id):
+        key = table_key(type, table_id)
+        artifacts = self.tables.get(key)
+        if artifacts is None:
+            artifacts = table_artifacts(type, self.df_dicts[type][table_id])
+            with self._lock:
+                self.tables[key] = artifacts
+        return artifacts
+
+    def options(self, type, table_id):
+        return [{'label' : col, 'value': col} for col in self.table(type, table_id)['options']]
+
+    #a player table's options followed by the stats of the other player tables, joined on
+    #player_id, Year and Tm by update_graph
+    def joined_options(self, table_id):
+        options = self.options('player', table_id)
+        for other_id in store.player_table_ids:
+            if other_id != table_id:
+                options += [
+                    {'label' : '{}: {}'.format(other_id.title(), col), 'value' : players.qualified_column(other_id, col)}
+                    for col in self.table('player', other_id)['options'] if col in self.table('player', other_id)['year_stats']
+                ]
+        return options
+
+    def teams(self, year):
+        return self.table('merged', 'team_stats')['teams_by_year'].get(str(year), [])
+
+    #min, max, mean and count of a column over a set of seasons, None for columns that aren't stats
+    def column_stats(self, type, table_id, col, years):
+        col_stats = self.table(type, table_id)['year_stats'].get(col)
+        if col_stats is None:
+            return None
+        return combine_year_stats(col_stats, years)
+
+    def league_mean(self, table_id, col):
+        return self.table('merged', table_id)['league_mean'][col]
+
+    def league_range(self, table_id, col):
+        artifacts = self.table('merged', table_id)
+        return [artifacts['league_min'][col], artifacts['league_max'][col]]
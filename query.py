@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import functools
+import threading
+import pandas as pd
+import schema
+import store
+import filters
+import franchise
+
+"""Queries the callbacks run against a table: rows in a set of seasons and (col, low, high)
+ranges, distinct names, a column's range and rows by team and season. PandasBackend answers them from the
+snapshot's resident frames, SQLiteBackend from the indexed database scrape/build_database.py
+writes, so workers don't need whole tables in memory to serve a filtered view"""
+
+database_path = r'data/nfl.sqlite'
+
+#columns indexed in every table, each tuple is one index
+player_indexes = [('Year',), ('Player',), ('Tm', 'Year')]
+merged_indexes = [('Year',), ('Tm', 'Year'), ('franchise', 'Year')]
+
+def sql_table(type, table_id):
+    return '{}_{}'.format(type, table_id)
+
+#column names like Y/A and 1D% have to be quoted
+def quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+#rows of a table for a list of (Tm, Year) keys in the order given, with Tm and Year first
+class PandasBackend:
+    name = 'pandas'
+
+    def __init__(self, df_dicts):
+        self.df_dicts = df_dicts
+        self.filters = filters.FilterEngine()
+        self.franchises = franchise.FranchiseIndex(df_dicts['merged'])
+        self._key_positions = {}
+        self._lock = threading.Lock()
+
+    def select(self, type, table_id, years, ranges = None):
+        df = self.df_dicts[type][table_id]
+        if not ranges:
+            return store.select_years(df, years)
+        return df.take(self.filters.positions((type, table_id), df, years, list(ranges)))
+
+    def unique(self, type, table_id, col, years):
+        return list(store.select_years(self.df_dicts[type][table_id], years)[col].unique())
+
+    #distinct (name, Year) rows of a name column, what the search index is built from
+    def names(self, type, table_id, col):
+        return self.df_dicts[type][table_id][[col, 'Year']].drop_duplicates()
+
+    def column_range(self, type, table_id, col, years):
+        series = store.select_years(self.df_dicts[type][table_id], years)[col]
+        return series.min(), series.max()
+
+    def franchise_history(self, table_id, franchise_ids, years = None):
+        return self.franchises.history(table_id, franchise_ids, years)
+
+    #row position of each (Tm, Year) of a team table, built once per snapshot
+    def key_positions(self, type, table_id):
+        positions = self._key_positions.get((type, table_id))
+        if positions is None:
+            df = self.df_dicts[type][table_id]
+            positions = {(tm, int(year)) : i for i, (tm, year) in enumerate(zip(df['Tm'], df['Year']))}
+            with self._lock:
+                self._key_positions[(type, table_id)] = positions
+        return positions
+
+    #a dictionary lookup per key, keys of a team that didn't play that season are left out
+    def rows(self, type, table_id, keys):
+        positions = self.key_positions(type, table_id)
+        found = [positions[key] for key in ((tm, int(year)) for tm, year in keys) if key in positions]
+        df = self.df_dicts[type][table_id].take(found)
+        return df[['Tm', 'Year'] + [col for col in df.columns if col not in ['Tm', 'Year']]].reset_index(drop = True)
+
+    #rows of the same (Tm, Year) keys in each of table_ids, in key order
+    def rows_many(self, type, table_ids, keys):
+        keys = [(tm, int(year)) for tm, year in keys]
+        return {table_id : self.rows(type, table_id, keys) for table_id in table_ids}
+
+#a query of the sqlite backend on a thread that can't open the database of its snapshot any more
+#is answered by fallback instead, the backend over the same snapshot's frames
+def with_fallback(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.fallback is not None and getattr(self._local, 'connection', None) is None:
+            try:
+                self.connection()
+            except store.StaleSnapshot:
+                return getattr(self.fallback, method.__name__)(*args, **kwargs)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+class SQLiteBackend:
+    name = 'sqlite'
+
+    def __init__(self, path = database_path, read = None, fallback = None):
+        self.path = path
+        self.read = read
+        self.fallback = fallback
+        self._local = threading.local()
+
+    #one read-only connection per thread, sqlite connections can't be shared between threads. a
+    #connection keeps reading the file it opened after a new database is moved over it, so only
+    #opening one goes through read, see snapshot.Snapshot.read. once that raises the queries of
+    #the thread go to fallback, see with_fallback
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.open() if self.read is None else self.read(self.open)
+            self._local.connection = connection
+        return connection
+
+    #the schema is read so the file is open before read checks data/ again
+    def open(self):
+        connection = sqlite3.connect('file:{}?mode=ro'.format(self.path), uri = True)
+        connection.execute('SELECT count(*) FROM sqlite_master').fetchall()
+        return connection
+
+    def query(self, sql, params = ()):
+        df = pd.read_sql_query(sql, self.connection(), params = list(params))
+        #a stat that is null in every returned row comes back as objects
+        for col in df.columns:
+            if df[col].dtype == object and col not in schema.category_columns + schema.record_columns:
+                df[col] = pd.to_numeric(df[col])
+        #databases written before the point labels were stored get them here
+        return schema.apply_schema(store.assign_labels(df))
+
+    def where_years(self, years, ranges = None):
+        clauses = ['"Year" IN ({})'.format(', '.join('?' * len(years)))]
+        params = [int(year) for year in years]
+        for col, low, high in ranges or []:
+            clauses.append('{} BETWEEN ? AND ?'.format(quote(col)))
+            params += [float(low), float(high)]
+        return ' AND '.join(clauses), params
+
+    #ordered by rowid so rows come back in table order whichever index answers the query
+    @with_fallback
+    def select(self, type, table_id, years, ranges = None):
+        where, params = self.where_years(years, ranges)
+        sql = 'SELECT * FROM {} WHERE {} ORDER BY rowid'.format(quote(sql_table(type, table_id)), where)
+        return self.query(sql, params)
+
+    @with_fallback
+    def unique(self, type, table_id, col, years):
+        where, params = self.where_years(years)
+        sql = 'SELECT {col} FROM {table} WHERE {where} GROUP BY {col} ORDER BY MIN(rowid)'.format(
+            col = quote(col), table = quote(sql_table(type, table_id)), where = where
+        )
+        return [row[0] for row in self.connection().execute(sql, params).fetchall() if row[0] is not None]
+
+    @with_fallback
+    def names(self, type, table_id, col):
+        sql = 'SELECT DISTINCT {col}, "Year" FROM {table} ORDER BY rowid'.format(col = quote(col), table = quote(sql_table(type, table_id)))
+        return pd.read_sql_query(sql, self.connection())
+
+    @with_fallback
+    def column_range(self, type, table_id, col, years):
+        where, params = self.where_years(years)
+        sql = 'SELECT MIN({col}), MAX({col}) FROM {table} WHERE {where}'.format(
+            col = quote(col), table = quote(sql_table(type, table_id)), where = where
+        )
+        return self.connection().execute(sql, params).fetchone()
+
+    @with_fallback
+    def franchise_history(self, table_id, franchise_ids, years = None):
+        franchise_ids = list(franchise_ids)
+        clauses = ['"franchise" IN ({})'.format(', '.join('?' * len(franchise_ids)))]
+        params = franchise_ids
+        if years is not None:
+            where, year_params = self.where_years(years)
+            clauses.append(where)
+            params = params + year_params
+        sql = 'SELECT * FROM {} WHERE {} ORDER BY rowid'.format(quote(sql_table('merged', table_id)), ' AND '.join(clauses))
+        return self.query(sql, params)
+
+    #the keys are joined to the table as a values list, so each is one (Tm, Year) index lookup
+    #and the rows come back in key order
+    @with_fallback
+    def rows(self, type, table_id, keys):
+        keys = list(keys)
+        table = quote(sql_table(type, table_id))
+        if not keys:
+            return self.query('SELECT * FROM {} WHERE 0'.format(table))
+        values = ', '.join('(?, ?, {})'.format(i) for i in range(len(keys)))
+        params = [value for tm, year in keys for value in (tm, int(year))]
+        sql = (
+            'WITH keys("Tm", "Year", "position") AS (VALUES {values}) '
+            'SELECT {table}.* FROM keys JOIN {table} ON {table}."Tm" = keys."Tm" AND {table}."Year" = keys."Year" '
+            'ORDER BY keys."position"'
+        ).format(values = values, table = table)
+        return self.query(sql, params)
+
+    def rows_many(self, type, table_ids, keys):
+        keys = list(keys)
+        return {table_id : self.rows(type, table_id, keys) for table_id in table_ids}
+
+#write every table the app serves into a new database and move it over the old one,
+#so workers reading the old file keep it until they reload
+def write_database(path = database_path):
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    franchise_df = franchise.read_franchise_table()
+    try:
+        for type, table_ids, indexes in [
+            ('player', store.player_table_ids, player_indexes),
+            ('merged', store.merged_table_ids, merged_indexes)
+        ]:
+            for table_id in table_ids:
+                #stored from the scraped values rather than the float32 copies, query results get the schema dtypes
+                if type in ['merged']:
+                    df = franchise.assign_franchises(store.merged_view(table_id), franchise_df)
+                else:
+                    df = store.assign_player_ids(store.read_csv_table(store.table_path(type, table_id)))
+                df = store.assign_labels(df)
+                table = sql_table(type, table_id)
+                df.to_sql(table, connection, index = False)
+                for columns in indexes:
+                    connection.execute('CREATE INDEX {} ON {} ({})'.format(
+                        quote('{}_{}'.format(table, '_'.join(columns))), quote(table), ', '.join(quote(col) for col in columns)
+                    ))
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+#backend named by NFL_PYPLOT_QUERY_BACKEND, falling back to the frames when there is no database
+#read, when given, wraps opening the database, and the frames answer the queries it refuses
+def open_backend(name, df_dicts, path = database_path, read = None):
+    if name in ['sqlite']:
+        if os.path.exists(path):
+            return SQLiteBackend(path, read, fallback = None if read is None else PandasBackend(df_dicts))
+        print('No database at {}, querying in-memory frames'.format(path))
+    return PandasBackend(df_dicts)
@@ -0,0 +1,93 @@
+import glob
+import numpy as np
+import pandas as pd
+
+"""Column schema for the player and merged team tables: the columns kept as categoricals or as
+formatted strings are listed by name and every other column is downcast to the smallest numeric
+dtype that holds it. Names are the ones pandas gives the scraped columns, so repeated headers are
+suffixed .1, .2, ... and merged team columns from the opponent tables are prefixed opp_"""
+
+#repeated strings, stored as categoricals
+category_columns = ['Player', 'Tm', 'Pos', 'player_id', 'franchise', 'abbreviation', 'split']
+#formatted strings such as QB records and drive times, never treated as numbers
+record_columns = ['QBrec', 'Start', 'Time', 'opp_Start', 'opp_Time']
+
+#short point label added at load, the last word of a player's or team's name
+label_column = 'split'
+#keys and labels the app adds to the scraped columns, never offered or shown as stats
+internal_columns = ['player_id', 'franchise', 'abbreviation', label_column]
+
+#decimals kept when float32 stats are handed to plotly and dash, the scraped data has at most two
+display_decimals = 3
+
+def smallest_int_dtype(series):
+    if len(series) == 0:
+        return series.dtype
+    low, high = series.min(), series.max()
+    for dtype in ['int8', 'int16', 'int32']:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype('int64')
+
+def typed_column(col, series):
+    if col in category_columns or col in record_columns:
+        if pd.api.types.is_categorical_dtype(series):
+            return series
+        if col in record_columns:
+            series = series.where(series.isna(), series.astype(str))
+        return series.astype('category')
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return series.astype(smallest_int_dtype(series), copy = False)
+    if pd.api.types.is_float_dtype(series):
+        return series.astype('float32', copy = False)
+    return series
+
+#downcast stats to the smallest dtype that holds them and make repeated strings categorical.
+#columns that already have their schema dtype are passed through without a copy,
+#so this is free on tables read from the column store
+def apply_schema(df):
+    columns = {col : typed_column(col, df[col]) for col in df.columns}
+    return pd.DataFrame(columns, columns = df.columns, copy = False)
+
+#float32 stats widened and rounded so figures and tables show 7.9 rather than 7.900000095367432
+def display_frame(df):
+    float_columns = [col for col in df.columns if df[col].dtype == np.float32]
+    if not float_columns:
+        return df
+    df = df.copy()
+    for col in float_columns:
+        df[col] = df[col].astype('float64').round(display_decimals)
+    return df
+
+def display_value(value):
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), display_decimals)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def memory_usage(df):
+    return int(df.memory_usage(index = True, deep = True).sum())
+
+#bytes before and after applying the schema to a table
+def bytes_saved(df, typed_df):
+    before, after = memory_usage(df), memory_usage(typed_df)
+    return {'before' : before, 'after' : after, 'saved' : before - after}
+
+def format_bytes_saved(report):
+    return '{:.2f} MB -> {:.2f} MB ({:.0%} saved)'.format(
+        report['before'] / 1e6, report['after'] / 1e6, report['saved'] / max(report['before'], 1))
+
+if __name__ == '__main__':
+    #report bytes saved per table for the player csvs in data/ and the merged team tables built from the team store
+    import store
+    for path in sorted(glob.glob('data/players/*.csv')):
+        df = store.read_csv_table(path)
+        print(path, format_bytes_saved(bytes_saved(df, apply_schema(df))))
+    store_columns = store.read_store_columns()
+    for table_id in store.merged_table_ids:
+        df = store.merged_view(table_id, store_columns = store_columns)
+        print('merged {}'.format(table_id), format_bytes_saved(bytes_saved(df, apply_schema(df))))
@@ -0,0 +1,14 @@
+import os
+import sys
+
+#make the app's modules importable when run as scrape/build_bundle.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import precompute
+
+#precompute the artifacts of every table the app serves into a versioned bundle
+def build_bundle():
+    precompute.write_bundle(precompute.compute_tables())
+    print('Saved artifact bundle version {} to {}'.format(precompute.bundle_version, precompute.bundle_path))
+
+if __name__ == '__main__':
+    build_bundle()
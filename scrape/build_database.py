@@ -0,0 +1,14 @@
+import os
+import sys
+
+#make the app's modules importable when run as scrape/build_database.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import query
+
+#write every table the app serves into the indexed sqlite database the sqlite query backend reads
+def build_database():
+    query.write_database()
+    print('Saved query database to {}'.format(query.database_path))
+
+if __name__ == '__main__':
+    build_database()
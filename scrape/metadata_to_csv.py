@@ -1,11 +1,56 @@
+import os
+import sys
 import pandas as pd
 from scrape import scrape_player_page
 from scrape import scrape_team_page
 import numpy as np
 
+#make the app's modules importable when run as scrape/metadata_to_csv.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import store
+import schema
+import players
+import franchise
+from build_bundle import build_bundle
+from build_database import build_database
+
+player_categories = ['passing',  'rushing', 'receiving', 'scrimmage', 'defense',  'kicking', 'returns', 'scoring']
+merged_table_ids = ['team_stats', 'passing', 'rushing', 'returns', 'kicking', 'team_scoring', 'team_conversions', 'drives']
+
+#write typed columnar copies and the shared column store of a table, with the schema dtypes applied,
+#the point labels added and its rows sorted by Year, so the app loads it without adding a column
+def to_columnar(df, csv_path):
+    typed_df = store.sort_by_year(schema.apply_schema(store.assign_labels(df)))
+    store.write_columnar_copies(typed_df, csv_path)
+    return schema.bytes_saved(df, typed_df)
+
+def csv_to_columnar(csv_path):
+    return to_columnar(store.read_csv_table(csv_path), csv_path)
+
+def player_csv_to_columnar(csv_path):
+    return to_columnar(store.assign_player_ids(store.read_csv_table(csv_path)), csv_path)
+
+#build the columnar copies of the player tables, the index joining them, the franchise table
+#and the merged team tables the app loads
+def csvs_to_columnar():
+    if not store.HAS_ARROW:
+        print('pyarrow not installed, only building the column store')
+    for category in player_categories:
+        report = player_csv_to_columnar(r'data/players/{}.csv'.format(category))
+        print('Saved {} as columnar, {}'.format(category, schema.format_bytes_saved(report)))
+    players.write_join_index({table_id : store.load_table('player', table_id) for table_id in store.player_table_ids})
+    print('Saved player join index')
+    franchise_df = franchise.write_franchise_table()
+    print('Saved franchise table')
+    store_columns = store.read_store_columns()
+    for table_id in merged_table_ids:
+        df = franchise.assign_franchises(store.merged_view(table_id, store_columns = store_columns), franchise_df)
+        report = to_columnar(df, r'data/teams/merged_{}.csv'.format(table_id))
+        print('Saved merged {} as columnar, {}'.format(table_id, schema.format_bytes_saved(report)))
+
 #update csvs from metata given a range of years
 def player_team_data_to_csvs(years):
-    categories = ['passing',  'rushing', 'receiving', 'scrimmage', 'defense',  'kicking', 'returns', 'scoring']
+    categories = player_categories
     team_table_ids = ['AFC', 'NFC', 'team_stats', 'passing', 'rushing', 'returns', 'kicking', 'team_scoring', 'team_conversions', 'drives']
     def_table_ids = ['team_stats', 'advanced_defense', 'passing', 'rushing', 'returns', 'kicking', 'team_scoring', 'team_conversions', 'drives']
 
@@ -69,65 +114,48 @@ def player_team_data_to_csvs(years):
             except Exception:
                 pass
                 
-    #merge team dataframes 
-    temp_def_df_dict = def_df_dict
+    #prefix opponent columns 
     for table_id in def_table_ids:
         if table_id not in ['advanced_defense']:
-            temp_def_df_dict[table_id] = temp_def_df_dict[table_id].set_index(['Tm', 'Year'])
-            for col in temp_def_df_dict[table_id].columns:
-                temp_def_df_dict[table_id] = temp_def_df_dict[table_id].rename(columns={col : 'opp_{}'.format(col)})
+            for col in def_df_dict[table_id].columns:
+                if col not in ['Tm', 'Year']:
+                    def_df_dict[table_id] = def_df_dict[table_id].rename(columns={col : 'opp_{}'.format(col)})
 
-    merged_table_ids = ['team_stats', 'passing', 'rushing', 'returns', 'kicking', 'team_scoring', 'team_conversions', 'drives']
-    merged_df_dict = {}
-    temp_team_df_dict = team_df_dict
-    for table_id in merged_table_ids:
-        temp_team_df_dict[table_id] = temp_team_df_dict[table_id].set_index(['Tm', 'Year'])
-        merged_df_dict[table_id] = pd.merge(temp_team_df_dict[table_id], temp_def_df_dict[table_id], left_index = True, right_index = True)
-        merged_df_dict[table_id] = merged_df_dict[table_id].reset_index()
-        
     #Save csvs
     try: 
         for category, df in player_df_dict.items():
-            df = df[df['Player'].notna()]
+            df = store.assign_player_ids(df[df['Player'].notna()])
             df.to_csv(r'data/players/{}.csv'.format(category))
             print('Saved {} as .csv'.format(category))
     except:
         print('Unable to save player {} as a CSV'.format(category))
-    
-    team_file_names = {'AFC': 'AFC', 'NFC' : 'NFC', 'team_stats' : 'team_stats', 'passing' : 'team_passing', 'rushing' : 'team_rushing', \
-                'returns' : 'team_returns', 'kicking' : 'team_kicking', 'team_scoring' : 'team_scoring', 'team_conversions' : 'team_conversions', \
-                'drives' : 'team_drives'}
-    try:
-        for table_id in team_table_ids:
-            team_df_dict[table_id].to_csv(r'data/teams/{}.csv'.format(team_file_names[table_id]))
-            print('Saved {} as .csv'.format(table_id))
-    except:
-        print('Unable to save team {} as a CSV'.format(table_id))
-
-    def_file_names = {'team_stats': 'opp_team_stats', 'advanced_defense': 'opp_advanced_defense', \
-        'passing': 'opp_passing', 'rushing' : 'opp_rushing', 'returns' : 'opp_returns', \
-        'kicking' : 'opp_kicking', 'team_scoring' : 'opp_team_scoring', 'team_conversions': 'opp_team_conversions', \
-        'drives' : 'opp_drives'}
 
-    for table_id in def_table_ids:
+    for table_id in ['AFC', 'NFC']:
         try:
-            def_df_dict[table_id].to_csv(r'data/teams/{}.csv'.format(def_file_names[table_id]))
-            print('Saved oppenent {} as .csv'.format(table_id))
-        except: 
-            print('Unable to save opponent {} as a CSV'.format(table_id))
+            team_df_dict[table_id].to_csv(r'data/teams/{}.csv'.format(table_id))
+            print('Saved {} as .csv'.format(table_id))
+        except Exception:
+            print('Unable to save team {} as a CSV'.format(table_id))
 
-    merged_file_names = {'team_stats': 'merged_team_stats', \
-        'passing': 'merged_passing', 'rushing' : 'merged_rushing', 'returns' : 'merged_returns', \
-        'kicking' : 'merged_kicking', 'team_scoring' : 'merged_team_scoring', 'team_conversions': 'merged_team_conversions', \
-        'drives' : 'merged_drives'}
+    #team and opponent tables go to the normalized team store, the merged tables are built from it
+    store_dict = {}
+    for table_id in def_table_ids:
+        team_df = team_df_dict[table_id] if table_id in team_table_ids else None
+        store_dict[table_id] = store.normalize_team_table(team_df, def_df_dict[table_id])
+    try:
+        store.write_team_store(store_dict)
+        print('Saved team store')
+    except Exception:
+        print('Unable to save the team store')
 
-    for table_id in merged_table_ids:
-        try:
-            merged_df_dict[table_id].to_csv(r'data/teams/{}.csv'.format(merged_file_names[table_id]))
-            print('Saved merged {} as csv'.format(table_id))
-        except Exception:
-            print('Unable to save merged {} as a CSV'.format(table_id))
+    csvs_to_columnar()
+    build_bundle()
+    build_database()
 
 if __name__ == '__main__':
-    #scrapes player and team stats for a range of years as the input 
-    player_team_data_to_csvs(range(2006, 2022))
+    if 'columnar' in sys.argv[1:]:
+        #rebuild the columnar copies from the csvs already in data/
+        csvs_to_columnar()
+    else:
+        #scrapes player and team stats for a range of years as the input 
+        player_team_data_to_csvs(range(2006, 2022))
@@ -0,0 +1,87 @@
+import bisect
+import threading
+
+"""Prefix index over player and team names for the search dropdown. Every word of a name is a
+token, and a query matches a name when each of its words starts a different token, so 'bra'
+finds Tom Brady and 'to bra' narrows it. Matches are limited to the selected seasons and only
+the top results go to the browser"""
+
+#matches sent to the search dropdown per query
+max_results = 20
+
+def tokens(name):
+    return name.lower().replace('.', ' ').split()
+
+class NameIndex:
+    #names is a frame of one name column and Year with a row per name and season
+    def __init__(self, names, col):
+        self.names = []
+        self.years = []
+        ids = {}
+        for name, year in zip(names[col], names['Year']):
+            if not isinstance(name, str):
+                continue
+            if name not in ids:
+                ids[name] = len(self.names)
+                self.names.append(name)
+                self.years.append(set())
+            self.years[ids[name]].add(int(year))
+        self.name_tokens = [tokens(name) for name in self.names]
+        entries = sorted((token, i) for i, name_tokens in enumerate(self.name_tokens) for token in set(name_tokens))
+        self.tokens = [token for token, i in entries]
+        self.token_ids = [i for token, i in entries]
+
+    #ids of the names with a token starting with prefix
+    def prefix_ids(self, prefix):
+        start = bisect.bisect_left(self.tokens, prefix)
+        stop = bisect.bisect_left(self.tokens, prefix + '\uffff', lo = start)
+        return set(self.token_ids[start:stop])
+
+    #each query word has to start a different token of the name
+    def matches(self, i, words):
+        name_tokens = list(self.name_tokens[i])
+        for word in sorted(words, key = len, reverse = True):
+            for token in name_tokens:
+                if token.startswith(word):
+                    name_tokens.remove(token)
+                    break
+            else:
+                return False
+        return True
+
+    #names matching query in any of years. names whose first word matches come first,
+    #then names in more of the selected seasons, then alphabetically
+    def search(self, query, years = None, limit = max_results):
+        words = tokens(query)
+        if not words:
+            return []
+        years = None if years is None else set(int(year) for year in years)
+        candidates = None
+        for word in words:
+            ids = self.prefix_ids(word)
+            candidates = ids if candidates is None else candidates & ids
+        results = []
+        for i in candidates:
+            seasons = len(self.years[i]) if years is None else len(self.years[i] & years)
+            if seasons and self.matches(i, words):
+                results.append((not self.name_tokens[i][0].startswith(words[0]), -seasons, self.names[i]))
+        return [name for first, seasons, name in sorted(results)[:limit]]
+
+#name indexes of a snapshot's tables, built the first time a table is searched
+class SearchIndexes:
+    def __init__(self, query):
+        self.query = query
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def index(self, type, table_id, col):
+        key = (type, table_id, col)
+        index = self._indexes.get(key)
+        if index is None:
+            index = NameIndex(self.query.names(type, table_id, col), col)
+            with self._lock:
+                self._indexes[key] = index
+        return index
+
+    def search(self, type, table_id, col, query, years, limit = max_results):
+        return self.index(type, table_id, col).search(query, years, limit)
@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+import store
+import precompute
+import query
+import search
+import players
+import franchise
+
+"""Versioned snapshots of the data the callbacks read. A callback takes the current snapshot
+once and reads everything from it, so a reload that swaps in a new snapshot never mixes
+versions inside a request and requests already running finish on the old one"""
+
+#files whose change means new data: the csvs and team store, their columnar copies and the bundle.
+#files and directories still being written by the build steps end in .tmp and are skipped
+def data_signature(data_dir = 'data'):
+    signature = []
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if not d.endswith('.tmp'))
+        for name in sorted(files):
+            if '.tmp' in name:
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+#one version of the player and merged team tables with the artifacts computed from them
+#and the backend the callbacks query them through
+class Snapshot:
+    def __init__(self, max_resident = 4, backend = 'pandas'):
+        self.signature = data_signature()
+        self.version = precompute.data_fingerprint()[:12]
+        self.loaded_at = time.time()
+        self.tables = store.PinnedTables(
+            [store.table_path('player', table_id) for table_id in store.player_table_ids] +
+            [store.table_path('merged', table_id) for table_id in store.merged_table_ids] +
+            [players.join_index_path],
+            read = self.read
+        )
+        self.player_df_dict = store.LazyTableDict(
+            lambda table_id: store.load_table('player', table_id, tables = self.tables),
+            store.player_table_ids,
+            max_resident = max_resident
+        )
+        self.franchise_table = franchise.read_franchise_table()
+        self.merged_df_dict = store.LazyTableDict(
+            lambda table_id: store.load_table('merged', table_id, prepare = lambda df: franchise.assign_franchises(df, self.franchise_table), tables = self.tables),
+            store.merged_table_ids,
+            max_resident = max_resident
+        )
+        self.bundle_tables = precompute.load_bundle()
+        self.artifacts = precompute.Artifacts({'player' : self.player_df_dict, 'merged' : self.merged_df_dict}, self.bundle_tables)
+        self.query = query.open_backend(backend, {'player' : self.player_df_dict, 'merged' : self.merged_df_dict}, read = self.read)
+        self.search = search.SearchIndexes(self.query)
+        self.players = players.PlayerJoin(self.player_df_dict, tables = self.tables)
+        #the version, pinned tables, franchise table and bundle read above all have to come from the same files
+        self.check_signature()
+
+    def check_signature(self):
+        if data_signature() != self.signature:
+            raise store.StaleSnapshot('data/ changed since version {} was loaded'.format(self.version))
+
+    #tables are loaded from the column stores pinned above, so a snapshot retiring after data/ has
+    #changed keeps serving its own version until the new one is swapped in. the reads of data/ that
+    #aren't pinned go through here: a table without a column store and a database connection opened
+    #on a new thread. the indexes already built hold rows of this version's files, so once data/ has
+    #changed the read raises rather than mixing in rows of the new files. the sqlite backend answers
+    #those queries from the frames instead, see query.with_fallback
+    def read(self, load):
+        self.check_signature()
+        value = load()
+        self.check_signature()
+        return value
+
+    def df_dict(self, type):
+        return self.player_df_dict if type in ['player'] else self.merged_df_dict
+
+    #min and max of a column over a set of seasons from the stats index, querying the table
+    #for columns the index doesn't cover. col may be another player table's column
+    def column_range(self, type, table_id, col, years):
+        other_id, col = players.split_column(col)
+        table_id = other_id or table_id
+        col_stats = self.artifacts.column_stats(type, table_id, col, years)
+        if col_stats is None:
+            return self.query.column_range(type, table_id, col, years)
+        return col_stats['min'], col_stats['max']
+
+    #load tables and their artifacts ahead of the first request that needs them
+    def warm(self, player_ids, merged_ids):
+        for type, table_ids in [('player', player_ids), ('merged', merged_ids)]:
+            for table_id in table_ids:
+                self.df_dict(type)[table_id]
+                self.artifacts.table(type, table_id)
+
+    def stats(self):
+        return {
+            'version' : self.version,
+            'loaded_at' : self.loaded_at,
+            'artifacts_from_bundle' : self.artifacts.from_bundle,
+            'query_backend' : self.query.name,
+            'player_tables' : self.player_df_dict.stats(),
+            'merged_tables' : self.merged_df_dict.stats()
+        }
+
+#holds the current snapshot and, every interval seconds, checks data/ for changes. a changed
+#data directory is loaded into a new snapshot in the background, warmed with the tables the current
+#one has resident and swapped in with a single reference assignment
+class SnapshotManager:
+    def __init__(self, max_resident = 4, interval = 30, backend = 'pandas'):
+        self.max_resident = max_resident
+        self.backend = backend
+        self.interval = interval
+        self.reloads = 0
+        self._current = Snapshot(max_resident, backend)
+        self._signature = self._current.signature
+        self._pending_signature = None
+        self._watcher_pid = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        #gunicorn may import the app before forking, so each worker process starts its own watcher
+        if self.interval > 0 and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        return self._current
+
+    def _start_watcher(self):
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            threading.Thread(target = self._watch, name = 'snapshot-watcher', daemon = True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print('Unable to reload data, keeping version {}: {}'.format(self._current.version, e))
+
+    #reload once data/ has changed and then stayed the same for a whole interval,
+    #so a snapshot is never built from a half written update
+    def check(self):
+        signature = data_signature()
+        if signature == self._signature:
+            self._pending_signature = None
+            return False
+        if signature != self._pending_signature:
+            self._pending_signature = signature
+            return False
+        self.reload()
+        return True
+
+    #a snapshot whose files change while it is built or warmed raises StaleSnapshot, and the watcher
+    #tries again once data/ is stable
+    def reload(self):
+        with self._lock:
+            old = self._current
+            new = Snapshot(self.max_resident, self.backend)
+            new.warm(old.player_df_dict.resident(), old.merged_df_dict.resident())
+            self._current = new
+            self._signature = new.signature
+            self._pending_signature = None
+            self.reloads += 1
+        print('Reloaded data version {} (was {})'.format(new.version, old.version))
+        return new
+
+    def stats(self):
+        return dict(self._current.stats(), reloads = self.reloads, reload_interval = self.interval)
@@ -0,0 +1,407 @@
+import os
+import re
+import json
+import mmap
+import shutil
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+import schema
+
+#pyarrow is optional, without it every table is read from its csv
+try:
+    import pyarrow
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+#read a scraped csv and coerce every column that holds numbers
+def read_csv_table(path):
+    df = pd.read_csv(path)
+    for col in df.columns:
+        df[col] = pd.to_numeric(df[col], errors = 'ignore')
+    return df
+
+#typed columnar copy lives next to the csv it was built from
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+#written beside the old copy and renamed over it, so a running app never reads a partial file
+def write_columnar(df, path):
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index = False)
+    os.replace(tmp_path, path)
+
+#shared column store: a directory per table with one .npy file per column and a manifest.
+#numeric columns are memory mapped read-only, so every gunicorn worker maps the same pages
+#instead of holding a private copy, and strings are stored as codes into a dictionary
+def column_store_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.columns'
+
+def write_column_store(df, path):
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors = True)
+    os.makedirs(tmp_path)
+    columns = []
+    for i, col in enumerate(df.columns):
+        column = {'name' : col, 'file' : '{}.npy'.format(i)}
+        if pd.api.types.is_numeric_dtype(df[col]):
+            values = df[col].to_numpy()
+        else:
+            categorical = pd.Categorical(df[col])
+            values = categorical.codes
+            column['categories'] = categorical.categories.tolist()
+        np.save(os.path.join(tmp_path, column['file']), values)
+        columns.append(column)
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+        json.dump({'rows' : len(df), 'columns' : columns}, f)
+    shutil.rmtree(path, ignore_errors = True)
+    os.rename(tmp_path, path)
+
+#the manifest of a column store and its column files, mapped
+def map_column_store(path):
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    return manifest, {column['file'] : np.load(os.path.join(path, column['file']), mmap_mode = 'r') for column in manifest['columns']}
+
+#mapped, when given, is what map_column_store returned for the store earlier
+def read_column_store(path, mapped = None):
+    manifest, arrays = map_column_store(path) if mapped is None else mapped
+    columns = {}
+    for column in manifest['columns']:
+        values = arrays[column['file']]
+        if 'categories' in column:
+            #codes are saved in the dtype pandas picks for them, so this keeps the mapping
+            values = pd.Categorical.from_codes(values, column['categories'])
+        columns[column['name']] = values
+    #copy = False keeps each column backed by its mapped file
+    return pd.DataFrame(columns, columns = [column['name'] for column in manifest['columns']], copy = False)
+
+#build the parquet copy and the shared column store of a csv's table, keeping the dtypes the app loads it with
+def write_columnar_copies(df, csv_path):
+    if HAS_ARROW:
+        write_columnar(df, columnar_path(csv_path))
+    write_column_store(df, column_store_path(csv_path))
+
+#load a table from the shared column store or its parquet copy when one exists, falling back to
+#building it with fallback, which reads the csv by default
+def read_table(csv_path, fallback = None):
+    store_path = column_store_path(csv_path)
+    if os.path.exists(os.path.join(store_path, 'manifest.json')):
+        return read_column_store(store_path)
+    parquet_path = columnar_path(csv_path)
+    if HAS_ARROW and os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+    if fallback is not None:
+        return fallback()
+    return read_csv_table(csv_path)
+
+#raised when a set of tables would read files of a newer version, see snapshot.Snapshot.read
+class StaleSnapshot(RuntimeError):
+    pass
+
+#the tables of a set as their files were when the set was made. each table's column store is mapped
+#up front, and a mapping keeps reading the file it opened after a rebuild renames new files over it,
+#so a table loaded later, e.g. again after it was evicted, still comes from the same version.
+#tables without a column store are read from disk through read, when given
+class PinnedTables:
+    def __init__(self, csv_paths, read = None):
+        self.read = read
+        self.mapped = {}
+        for csv_path in csv_paths:
+            store_path = column_store_path(csv_path)
+            if os.path.exists(os.path.join(store_path, 'manifest.json')):
+                self.mapped[csv_path] = map_column_store(store_path)
+
+    def read_table(self, csv_path, fallback = None):
+        if csv_path in self.mapped:
+            return read_column_store(column_store_path(csv_path), self.mapped[csv_path])
+        load = lambda: read_table(csv_path, fallback)
+        return load() if self.read is None else self.read(load)
+
+#normalized team store: one csv per team table with a row per Tm, Year and side, where side is
+#'team' for the team's own stats and 'opp' for its opponents' stats. columns.json lists the columns
+#each side was scraped with, in order, since a side's column may be empty for every row
+team_store_dir = r'data/teams/store'
+team_store_keys = ['Tm', 'Year', 'side']
+
+def team_store_path(table_id):
+    return os.path.join(team_store_dir, '{}.csv'.format(table_id))
+
+#name repeated columns Yds, Yds.1, Yds.2, ... the way read_csv does
+def dedupe_columns(df):
+    counts = {}
+    columns = []
+    for col in df.columns:
+        if col in counts:
+            counts[col] += 1
+            columns.append('{}.{}'.format(col, counts[col]))
+        else:
+            counts[col] = 0
+            columns.append(col)
+    df = df.copy()
+    df.columns = columns
+    return df
+
+#stack a team table and its opp_ prefixed opponent table into one store table,
+#returning it with the columns of each side. either table may be None
+def normalize_team_table(team_df, opp_df):
+    frames = []
+    side_columns = {}
+    for side, df in [('team', team_df), ('opp', opp_df)]:
+        if df is None:
+            continue
+        df = dedupe_columns(df)
+        df = df.drop(columns = [col for col in df.columns if col.startswith('Unnamed')])
+        df = df.rename(columns = {col : col[len('opp_'):] for col in df.columns if col.startswith('opp_')})
+        side_columns[side] = [col for col in df.columns if col not in team_store_keys]
+        frames.append(df.assign(side = side))
+    df = pd.concat(frames, ignore_index = True, sort = False)
+    return df[team_store_keys + [col for col in df.columns if col not in team_store_keys]], side_columns
+
+def read_store_columns():
+    with open(os.path.join(team_store_dir, 'columns.json')) as f:
+        return json.load(f)
+
+def write_team_store(store_dict):
+    os.makedirs(team_store_dir, exist_ok = True)
+    store_columns = {}
+    for table_id, (df, side_columns) in store_dict.items():
+        df.to_csv(team_store_path(table_id), index = False)
+        store_columns[table_id] = side_columns
+    with open(os.path.join(team_store_dir, 'columns.json'), 'w') as f:
+        json.dump(store_columns, f, indent = 1)
+
+def read_team_store(table_id):
+    return read_csv_table(team_store_path(table_id))
+
+#one side of a store table with the columns and dtypes it was scraped with
+def team_side(store_df, side, columns):
+    df = store_df[store_df['side'] == side][['Tm', 'Year'] + columns].reset_index(drop = True)
+    for col in columns:
+        #the other side's empty cells turn int columns into floats in the store csv
+        if pd.api.types.is_float_dtype(df[col]) and df[col].notna().all() and (df[col] % 1 == 0).all():
+            df[col] = df[col].astype('int64')
+    return df
+
+#wide team table the app reads: a row per Tm and Year with the team's columns followed by
+#the opponents' columns prefixed opp_
+def merged_view(table_id, store_df = None, store_columns = None):
+    if store_df is None:
+        store_df = read_team_store(table_id)
+    if store_columns is None:
+        store_columns = read_store_columns()
+    side_columns = store_columns[table_id]
+    team_df = team_side(store_df, 'team', side_columns['team'])
+    opp_df = team_side(store_df, 'opp', side_columns['opp'])
+    opp_df = opp_df.rename(columns = {col : 'opp_{}'.format(col) for col in side_columns['opp']})
+    return pd.merge(team_df, opp_df, on = ['Tm', 'Year'])
+
+#stable player ids: the player's name with the year they were born, from Year - Age, so players
+#sharing a name get different ids and a player has the same id in every category. a row without
+#an Age gets the name with its team and season instead, an id of that season only
+def slug(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+def player_ids(df):
+    years = pd.to_numeric(df['Year'])
+    birth_years = years - pd.to_numeric(df['Age'], errors = 'coerce')
+    return [
+        '{}-{}'.format(slug(str(name)), int(birth_year)) if pd.notna(birth_year) else '{}-{}-{}'.format(slug(str(name)), slug(str(tm)), int(year))
+        for name, tm, year, birth_year in zip(df['Player'], df['Tm'], years, birth_years)
+    ]
+
+#player table with a player_id column, tables scraped before ids were assigned get theirs here
+def assign_player_ids(df):
+    if 'player_id' in df.columns:
+        return df
+    return df.assign(player_id = player_ids(df))
+
+#tables the app serves
+player_table_ids = ['passing',  'rushing', 'receiving', 'scrimmage', 'defense', 'returns', 'scoring']
+merged_table_ids = ['team_stats', 'passing', 'rushing', 'returns', 'team_scoring', 'team_conversions', 'drives']
+
+#csv path a table's columnar copies are kept under. merged team tables have no csv,
+#they are built from the normalized team store when no columnar copy exists
+def table_path(type, table_id):
+    if type in ['player']:
+        return r'data/players/{}.csv'.format(table_id)
+    if type in ['merged']:
+        return r'data/teams/merged_{}.csv'.format(table_id)
+
+#tables are kept sorted by season, so the rows of a season are one contiguous slice.
+#the columnar copies are written sorted and pass through without a copy
+def sort_by_year(df):
+    if df['Year'].is_monotonic_increasing:
+        return df
+    return df.sort_values('Year', kind = 'mergesort').reset_index(drop = True)
+
+#season to (first row, last row + 1) of a table sorted by Year
+def year_ranges(df):
+    years = df['Year'].to_numpy()
+    values, starts = np.unique(years, return_index = True)
+    stops = np.append(starts[1:], len(years))
+    return {int(year) : (int(start), int(stop)) for year, start, stop in zip(values, starts, stops)}
+
+#(start, stop) row slices of a set of seasons in a table sorted by Year. adjacent seasons are
+#joined into one slice
+def year_slices(df, years):
+    ranges = df.attrs.get('year_ranges') or year_ranges(df)
+    slices = []
+    for year in sorted(set(int(year) for year in years)):
+        if year not in ranges:
+            continue
+        start, stop = ranges[year]
+        if slices and slices[-1][1] == start:
+            slices[-1] = (slices[-1][0], stop)
+        else:
+            slices.append((start, stop))
+    return slices
+
+#rows of a table in a set of seasons, a single season or a run of consecutive ones is a view
+#of the table rather than a filtered copy
+def select_years(df, years):
+    slices = year_slices(df, years)
+    if not slices:
+        return df.iloc[0:0]
+    if len(slices) == 1:
+        return df.iloc[slices[0][0]:slices[0][1]]
+    return pd.concat([df.iloc[start:stop] for start, stop in slices])
+
+#df with the point label column, the last word of each player's name, or of each team's name in
+#the team tables. on a categorical name the words are split once per name rather than once per row
+def assign_labels(df):
+    if schema.label_column in df.columns:
+        return df
+    names = df['Player'] if 'Player' in df.columns else df['Tm']
+    return df.assign(**{schema.label_column : names.str.split().str[-1]})
+
+#a loaded table shared by every request, and by every thread of a threaded worker. changing its
+#columns, rows or axes raises, and its column arrays are read-only so writing values into it through
+#.loc, .iloc or .to_numpy() raises too. frames derived from it, e.g. slices, copies and assign,
+#are plain dataframes, slices share its read-only arrays
+class FrozenFrame(pd.DataFrame):
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def frozen(self, *args, **kwargs):
+        raise TypeError('loaded tables are shared between requests, assign columns to a copy, e.g. with df.assign')
+
+    #assigning, inserting or deleting a column, setting df.columns or df.index, replacing a whole
+    #column through .loc or .iloc, and every method with inplace = True, e.g. drop, sort_values,
+    #dropna or rename, which replace the frame's data or axes through _update_inplace or _set_axis
+    __setitem__ = __delitem__ = insert = pop = frozen
+    _update_inplace = _set_axis = _set_item = _set_item_mgr = _iset_item = _iset_item_mgr = isetitem = frozen
+
+    #a column series changed in place, e.g. df['Yds'].clip(lower = 0, inplace = True), is written
+    #back through here. the series cached for the column is dropped so the frame keeps its own column
+    def _maybe_cache_changed(self, *args, **kwargs):
+        self._clear_item_cache()
+        self.frozen()
+
+    #adding a row through .loc replaces the frame's block manager, and an attribute named like a
+    #column would hide the column from df.name. other attributes, e.g. attrs, are set as usual
+    def __setattr__(self, name, value):
+        if name in ['_mgr'] or name in self.columns:
+            self.frozen()
+        super().__setattr__(name, value)
+
+    #the blocks stay as freeze left them, see freeze
+    def _consolidate_inplace(self):
+        pass
+
+#the arrays holding df's columns, the codes of categoricals
+def block_arrays(df):
+    for block in df._mgr.blocks:
+        values = block.values
+        if isinstance(values, pd.Categorical):
+            values = values._ndarray
+        if isinstance(values, np.ndarray):
+            yield values
+
+#the blocks are marked read-only where they are rather than consolidated, which would copy the
+#columns mapped from the column store into private arrays. the block manager is marked as already
+#consolidated too, otherwise older pandas consolidates it in place on e.g. drop or reindex
+def freeze(df):
+    df = FrozenFrame(df, copy = False)
+    for values in block_arrays(df):
+        values.flags.writeable = False
+    df._mgr._is_consolidated = df._mgr._known_consolidated = True
+    return df
+
+#whether an array's memory is a mapped file, following the views it was taken from
+def is_mapped(values):
+    while values is not None:
+        if isinstance(values, (np.memmap, mmap.mmap)):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+#(mapped, total) column arrays of df, every one of a table read from the column store is mapped
+def mapped_arrays(df):
+    arrays = list(block_arrays(df))
+    return sum(is_mapped(values) for values in arrays), len(arrays)
+
+#load a player or merged team table with the schema dtypes applied and point labels added, sorted
+#by Year with its season row ranges in attrs, and frozen. prepare adds columns the columnar copies may lack,
+#tables, when given, is the PinnedTables the table is read from
+def load_table(type, table_id, prepare = None, tables = None):
+    read = read_table if tables is None else tables.read_table
+    if type in ['merged']:
+        df = read(table_path(type, table_id), fallback = lambda: merged_view(table_id))
+    else:
+        df = assign_player_ids(read(table_path(type, table_id)))
+    if prepare is not None:
+        df = prepare(df)
+    df = freeze(sort_by_year(schema.apply_schema(assign_labels(df))))
+    df.attrs['year_ranges'] = year_ranges(df)
+    return df
+
+#read-only mapping of table id to dataframe that loads a table on first access
+#and keeps only the most recently used tables resident
+class LazyTableDict(Mapping):
+    def __init__(self, loader, table_ids, max_resident = 4):
+        self.loader = loader
+        self.table_ids = list(table_ids)
+        self.max_resident = max(1, max_resident)
+        self.hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, table_id):
+        if table_id not in self.table_ids:
+            raise KeyError(table_id)
+        with self._lock:
+            if table_id in self._tables:
+                self.hits += 1
+                self._tables.move_to_end(table_id)
+                return self._tables[table_id]
+            self.misses += 1
+        #load outside the lock so a slow read doesn't block lookups of resident tables
+        df = self.loader(table_id)
+        with self._lock:
+            self._tables[table_id] = df
+            self._tables.move_to_end(table_id)
+            while len(self._tables) > self.max_resident:
+                self._tables.popitem(last = False)
+        return df
+
+    def __contains__(self, table_id):
+        return table_id in self.table_ids
+
+    def __iter__(self):
+        return iter(self.table_ids)
+
+    def __len__(self):
+        return len(self.table_ids)
+
+    def resident(self):
+        with self._lock:
+            return list(self._tables)
+
+    def stats(self):
+        return {'hits' : self.hits, 'misses' : self.misses, 'resident' : self.resident(), 'max_resident' : self.max_resident}
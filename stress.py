@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import random
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import plotly.io.json
+import store
+import warmup
+
+"""Concurrency check of the callbacks before running the app on threaded workers, e.g. gunicorn
+--threads. Every callback is called from many threads at once, with the inputs of warmup.json and a
+set of views covering the rest of the app, and each result is compared with the same call made
+serially first. The figure caches are bypassed so every call reads the shared tables: a callback
+writing into one raises, see store.FrozenFrame, and one leaking state into another request returns
+a result that differs. Each way of changing a loaded table in place is first checked to raise and
+leave the table as it was. With NFL_PYPLOT_MAX_TABLES=1 tables are also loaded and evicted under the threads.
+After the threads every table read from the column store is checked to still be memory mapped,
+so the frozen tables aren't private copies in each worker
+
+    python stress.py [threads] [rounds]"""
+
+default_threads = 16
+default_rounds = 5
+
+#the output warmup.json names each cached callback by
+warmup_outputs = {
+    'update_graph' : 'graph_1.figure',
+    'update_compare_figures' : 'compare-graph-1.figure',
+    'pop_search_dropdown' : 'search-dropdown.options'
+}
+
+#inputs of the callbacks warmup.json doesn't cover and of views it doesn't draw, by an output of the callback
+views = [
+    ('page-content.children', ['/player-statistics']),
+    ('page-content.children', ['/team-comparison']),
+    ('category_dropdown.options', ['/team-statistics']),
+    ('x-axis.options', ['passing', '/player-statistics']),
+    ('y-axis.options', ['rushing', '/player-statistics']),
+    ('color.options', ['drives', '/team-statistics']),
+    ('size.options', ['team_stats', '/team-statistics']),
+    ('x-axis-range.value', ['rushing', [2020, 2021], 'Yds', '/player-statistics']),
+    ('y-axis-range.value', ['drives', [2021], 'Plays', '/team-statistics']),
+    ('x-axis-range.min', ['receiving', [2019, 2020], 'receiving:Yds', '/player-statistics', [0, 1000]]),
+    ('y-axis-range.min', ['passing', [2021], 'TD', '/team-statistics', [0, 60]]),
+    ('search-dropdown.options', ['receiving', [2019, 2020], '/player-statistics', 'dav', ['Davante Adams']]),
+    ('search-dropdown.options', ['passing', [2021], '/team-statistics', 'new', None]),
+    ('team-compare-teams.options', [[2020, 2021], ['Tampa Bay Buccaneers|2020']]),
+    ('compare-graph-1.figure', [['Tampa Bay Buccaneers|2020', 'Kansas City Chiefs|2021'], 'Y/A', 'opp_Y/A', 'Y/A', 'opp_Y/A', 'Yds', 'opp_Yds', 'Y/P', 'opp_Y/P', None, 'passing']),
+    ('graph_1.figure', ['passing', [2019, 2020, 2021], 'Yds', [0, 6000], 'TD', [0, 60], None, None, None, '/player-statistics', ['Tom Brady', 'Drew Brees'], 'points']),
+    ('graph_1.figure', ['passing', [2020], 'Yds', [0, 6000], 'TD', [0, 60], 'Pos', 'Att', None, '/player-statistics', None, 'points']),
+    ('graph_1.figure', ['defense', [2020, 2021], 'Sk', [0, 30], 'Comb', [0, 200], 'Pos', None, None, '/player-statistics', None, 'points']),
+    ('graph_1.figure', ['rushing', [2021], 'Yds', [0, 2000], 'receiving:Yds', [0, 2000], 'TD', None, None, '/player-statistics', None, 'points']),
+    ('graph_1.figure', ['defense', list(range(2006, 2022)), 'Sk', [0, 30], 'Comb', [0, 200], None, None, None, '/player-statistics', None, 'points']),
+    ('graph_1.figure', ['defense', list(range(2006, 2022)), 'Sk', [0, 30], 'Comb', [0, 200], None, None, None, '/player-statistics', ['J.J. Watt'], 'density']),
+    ('graph_1.figure', ['passing', [2020], 'Yds', [0, 6000], 'TD', [0, 60], None, None, None, '/team-statistics', ['Tampa Bay Buccaneers'], 'points']),
+]
+
+#the function dash calls for the callback writing output, under the figure cache when it has one
+def callback(dash_app, output):
+    for key, entry in dash_app.callback_map.items():
+        if output in key.strip('.').split('...'):
+            f = entry['callback'].__wrapped__
+            return getattr(f, '__wrapped__', f)
+    raise KeyError(output)
+
+#(output, inputs) of every call, the warm-up entries with their inputs resolved as the warm-up does
+def calls(snapshots, path = warmup.warmup_path):
+    entries = [(warmup_outputs[entry['callback']], warmup.entry_args(snapshots, entry)) for entry in warmup.read_entries(path)]
+    return entries + views
+
+#results are compared as the json dash would send
+def encode(result):
+    return plotly.io.json.to_json_plotly(result)
+
+#tables with a column store whose loaded frame holds columns that aren't mapped from it
+def unmapped_tables(snapshots):
+    snap = snapshots.current()
+    unmapped = []
+    for type, table_ids in [('player', store.player_table_ids), ('merged', store.merged_table_ids)]:
+        for table_id in table_ids:
+            if not os.path.exists(store.column_store_path(store.table_path(type, table_id))):
+                continue
+            mapped, total = store.mapped_arrays(snap.df_dict(type)[table_id])
+            if mapped < total:
+                unmapped.append((type, table_id, mapped, total))
+    return unmapped
+
+#ways a callback could change a loaded table in place
+mutations = [
+    ('df[col] = ...', lambda df, col: df.__setitem__(col, 0)),
+    ('del df[col]', lambda df, col: df.__delitem__(col)),
+    ('df.columns = ...', lambda df, col: setattr(df, 'columns', [str(c) + '_' for c in df.columns])),
+    ('df.index = ...', lambda df, col: setattr(df, 'index', df.index + 1)),
+    ('df.col = ...', lambda df, col: setattr(df, col, 0)),
+    ('drop inplace', lambda df, col: df.drop(columns = [col], inplace = True)),
+    ('sort_values inplace', lambda df, col: df.sort_values(col, ascending = False, inplace = True)),
+    ('dropna inplace', lambda df, col: df.dropna(inplace = True)),
+    ('rename inplace', lambda df, col: df.rename(columns = {col : col + '_'}, inplace = True)),
+    ('fillna inplace', lambda df, col: df.fillna(0, inplace = True)),
+    ('.loc column', lambda df, col: df.loc.__setitem__((slice(None), col), 'x')),
+    ('.loc value', lambda df, col: df.loc.__setitem__((df.index[0], col), 0)),
+    ('.loc new row', lambda df, col: df.loc.__setitem__((len(df) + 1, col), 0)),
+    ('column inplace', lambda df, col: df[col].fillna(0, inplace = True)),
+    ('to_numpy', lambda df, col: df[col].to_numpy().__setitem__(0, 0)),
+]
+
+#mutations that didn't raise, or that changed the table while raising
+def mutable_tables(snapshots):
+    snap = snapshots.current()
+    df = snap.player_df_dict['passing']
+    col = 'Yds'
+    before = (list(df.columns), df.index.copy(), df[col].copy(), dict(df.attrs['year_ranges']))
+    failures = []
+    for name, mutate in mutations:
+        try:
+            mutate(df, col)
+            failures.append((name, 'did not raise'))
+        except (TypeError, ValueError):
+            pass
+        if (list(df.columns), dict(df.attrs['year_ranges'])) != (before[0], before[3]) or not df.index.equals(before[1]) or not df[col].equals(before[2]):
+            failures.append((name, 'changed the table'))
+    return failures
+
+#call every view rounds times from threads, in a different order each round, and count the calls
+#that raised or returned something other than the serial result
+def run(dash_app, snapshots, threads = default_threads, rounds = default_rounds):
+    mutable = mutable_tables(snapshots)
+    for name, failure in mutable:
+        print('{} {}'.format(name, failure))
+    entries = calls(snapshots)
+    functions = {output : callback(dash_app, output) for output, args in entries}
+    expected = [encode(functions[output](*args)) for output, args in entries]
+
+    def check(i):
+        output, args = entries[i]
+        try:
+            if encode(functions[output](*args)) != expected[i]:
+                return 'mismatch', output, args, None
+        except Exception:
+            return 'error', output, args, traceback.format_exc()
+        return None
+
+    order = [i for round in range(rounds) for i in random.sample(range(len(entries)), len(entries))]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers = threads) as executor:
+        failures = [failure for failure in executor.map(check, order) if failure is not None]
+    took = round(time.time() - start, 3)
+    unmapped = unmapped_tables(snapshots)
+    for type, table_id, mapped, total in unmapped:
+        print('unmapped {} {}: {} of {} column arrays mapped'.format(type, table_id, mapped, total))
+
+    for kind, output, args, trace in failures:
+        print('{} {} {}'.format(kind, output, args))
+        if trace is not None:
+            print(trace)
+    print('{} calls of {} views on {} threads in {}s, {} errors, {} mismatches, {} unmapped tables, {} mutations allowed'.format(
+        len(order), len(entries), threads, took,
+        sum(failure[0] in ['error'] for failure in failures), sum(failure[0] in ['mismatch'] for failure in failures), len(unmapped), len(mutable)
+    ))
+    return not failures and not unmapped and not mutable
+
+if __name__ == '__main__':
+    import app
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else default_threads
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else default_rounds
+    sys.exit(0 if run(app.app, app.snapshots, threads, rounds) else 1)
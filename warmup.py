@@ -0,0 +1,188 @@
+import os
+import json
+import stat
+import time
+import tempfile
+import threading
+import cache
+import schema
+
+"""Warm-up run by each gunicorn worker before it takes requests, see gunicorn.conf.py. It calls the
+cached callbacks with the inputs listed in warmup.json and the most requested inputs recorded from
+traffic, so the first users after a deploy don't pay for loading tables, building indexes and
+drawing the popular views, and /ready answers 503 until it finishes"""
+
+#checked in list of callback inputs to warm, {'callback' : name, 'args' : [...]} each. 'latest' in
+#place of the years is the latest season of the category, and null slider bounds are the column's range
+warmup_path = r'warmup.json'
+
+#seconds between writes of the traffic file, and how many of the most requested inputs it keeps
+flush_interval = 60
+max_entries = 200
+
+#counts of the normalized inputs the cached callbacks are called with, so the inputs users ask for
+#most are warmed at the next start. a request only counts in memory: each worker's flusher thread
+#merges the counts into a json file every flush_interval seconds, and the worker does once more as
+#it exits, see gunicorn.conf.py. only the max_entries most requested inputs are kept, in memory
+#and in the file, so neither grows with every slider position and partly typed search
+class TrafficLog:
+    def __init__(self, path, flush_interval = flush_interval, max_entries = max_entries):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self.paused = False
+        self._counts = {}
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def record(self, callback, args):
+        if self.paused:
+            return
+        key = cache.cache_key(callback, args)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            #the inputs asked for least are dropped once there are many more than the file keeps
+            if len(self._counts) > 10 * self.max_entries:
+                self._counts = dict(most_requested(self._counts, self.max_entries))
+        #gunicorn may import the app before forking, so each worker process starts its own flusher
+        if self.flush_interval > 0 and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target = self._flush_every_interval, name = 'traffic-flusher', daemon = True).start()
+
+    def _flush_every_interval(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    #the recorded inputs are replayed into the callbacks, so a file this user doesn't own, a link, or
+    #one others can write to, e.g. left at the same path in a shared /tmp, is ignored
+    def entries(self):
+        try:
+            info = os.lstat(self.path)
+        except OSError:
+            return []
+        if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+            print('Ignoring traffic file {}, it is not a file only this user can write'.format(self.path))
+            return []
+        return read_entries(self.path)
+
+    #add the counts recorded since the last flush to the file's and keep the most requested, written
+    #beside the file and renamed over it. workers flushing at the same time may drop each other's
+    #counts, which only costs a little accuracy. a missing directory is made private to this user
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return
+        recorded = self.entries()
+        totals = {cache.cache_key(entry['callback'], entry['args']) : entry.get('count', 0) for entry in recorded}
+        for key, count in counts.items():
+            totals[key] = totals.get(key, 0) + count
+        entries = []
+        for key, count in most_requested(totals, self.max_entries):
+            callback, args = json.loads(key)
+            entries.append({'callback' : callback, 'args' : args, 'count' : count})
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, mode = 0o700, exist_ok = True)
+            fd, tmp_path = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+#the n (key, count) pairs of counts with the highest counts, highest first
+def most_requested(counts, n):
+    return sorted(counts.items(), key = lambda item: -item[1])[:n]
+
+def read_entries(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def latest_years(snap, category, pathname):
+    type = 'merged' if pathname in ['/team-statistics'] else 'player'
+    return snap.artifacts.table(type, category)['years'][-1:]
+
+#the inputs of an entry as the browser would send them: the latest season for 'latest' and the
+#range sliders at the column's range, as x_range_min_max sets them
+def entry_args(snapshots, entry):
+    snap = snapshots.current()
+    args = list(entry['args'])
+    if entry['callback'] in ['update_graph']:
+        type = 'merged' if args[9] in ['/team-statistics'] else 'player'
+        if args[1] in ['latest']:
+            args[1] = latest_years(snap, args[0], args[9])
+        for axis, values in [(2, 3), (4, 5)]:
+            if args[values] is None:
+                args[values] = [schema.display_value(value) for value in snap.column_range(type, args[0], args[axis], args[1])]
+    elif entry['callback'] in ['pop_search_dropdown'] and args[1] in ['latest']:
+        args[1] = latest_years(snap, args[0], args[2])
+    return args
+
+#callbacks maps the name of each callback entries may name to the function dash registered
+class Warmup:
+    def __init__(self, callbacks, snapshots, traffic_log = None, recorded = 20, path = warmup_path):
+        self.callbacks = callbacks
+        self.snapshots = snapshots
+        self.traffic_log = traffic_log
+        self.recorded = recorded
+        self.path = path
+        self.status = 'pending'
+        self.took = None
+        self.warmed = 0
+        self.failed = 0
+
+    #the configured inputs followed by the most requested recorded ones
+    def entries(self):
+        entries = read_entries(self.path)
+        if self.traffic_log is not None and self.recorded:
+            entries += self.traffic_log.entries()[:self.recorded]
+        return entries
+
+    #notify is called between entries, gunicorn passes the worker's heartbeat so a long warm-up
+    #isn't taken for a hung worker
+    def run(self, notify = None):
+        self.status = 'running'
+        start = time.time()
+        if self.traffic_log is not None:
+            self.traffic_log.paused = True
+        try:
+            for entry in self.entries():
+                if notify is not None:
+                    notify()
+                try:
+                    self.callbacks[entry['callback']].__wrapped__(*entry_args(self.snapshots, entry))
+                    self.warmed += 1
+                except Exception as e:
+                    self.failed += 1
+                    print('Warm-up of {} {} failed: {}'.format(entry.get('callback'), entry.get('args'), e))
+        finally:
+            if self.traffic_log is not None:
+                self.traffic_log.paused = False
+            self.took = round(time.time() - start, 3)
+            self.status = 'ready'
+        print('Warmed {} views in {}s, {} failed'.format(self.warmed, self.took, self.failed))
+
+    #with the warm-up turned off the worker is ready at once
+    def skip(self):
+        self.status = 'ready'
+
+    def ready(self):
+        return self.status in ['ready']
+
+    def stats(self):
+        return {'status' : self.status, 'warmed' : self.warmed, 'failed' : self.failed, 'took' : self.took}